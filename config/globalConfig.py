@@ -45,3 +45,162 @@ ControlledStopTime = '23:00:00'
 
 # set a countdown timer (in hours) for Panopto processing duration
 PanoptoCountdown = 2
+
+# Set number of recordings downloaded in parallel from Collab (per course)
+DownloadConcurrency = 4
+
+# Set number of times an interrupted download is resumed (HTTP Range) before it counts as failed
+DownloadRetries = 3
+
+# Set time sleep (in seconds) before resuming an interrupted download
+DownloadRetrySleep = 10
+
+# Set age (in days) after which unfinished .part downloads are discarded by the pre-run reset
+DownloadPartMaxAge = 7
+
+# Set size (in bytes) of the chunks read from a recording stream and written to disk
+DownloadChunkSize = 1024 * 1024
+
+# Set time interval (in seconds) between download progress updates (progress bar + resume checkpoint)
+DownloadProgressInterval = 2
+
+# Preallocate the full recording size on disk before downloading
+# possible values: Yes or No
+DownloadPreallocate = 'Yes'
+
+# Select how recordings are transferred from Collab to Panopto
+# possible values: Spool (download to SpoolPath, then upload), Stream (Collab stream piped into the Panopto upload, no local copy)
+TransferMode = 'Spool'
+
+# Set size (in bytes) from which a recording is downloaded as parallel byte ranges (if the server accepts ranges)
+SegmentedDownloadThreshold = 512 * 1024 * 1024
+
+# Set number of parallel byte ranges (connections) used for a segmented download
+DownloadSegments = 4
+
+# Compute a checksum of single-stream downloads while they are written, checked against the server Content-MD5 when given
+# (downloads without one are verified on their size only)
+# possible values: None, md5 or sha256
+DownloadChecksum = 'md5'
+
+# Also treat a 32 hex digit ETag as the MD5 of the recording (only if the storage ETags are known to be content MD5s)
+# possible values: Yes or No
+DownloadChecksumEtag = 'No'
+
+# Set number of downloaded courses that can wait for upload (download/upload pipeline back-pressure)
+PipelineQueueSize = 2
+
+# Set number of courses uploaded to Panopto in parallel by the pipeline
+PipelineUploadWorkers = 1
+
+# Set number of recording objects requested from Collab at once (DB data source)
+RecordingFetchConcurrency = 8
+
+# Resolve batches of Collab recording calls (recording objects, public data probes, deletions) on one asyncio event loop
+# instead of a thread pool of RecordingFetchConcurrency threads
+# possible values: Yes or No
+CollabAsyncClient = 'No'
+
+# Set number of concurrent connections to Collab used by the async client
+AsyncCollabConcurrency = 32
+
+# Set number of seconds Collab recording objects and public recording data are cached on disk (0 disables the cache)
+# a preview followed by the actual run, or a restart, reuses the cached responses
+RecordingCacheTTL = 12 * 60 * 60
+
+# Set file of the recording cache (SQLite)
+RecordingCachePath = './data/recording_cache.db'
+
+# Set maximum number of Collab API calls per second, shared by all threads and the async client
+CollabRateLimit = 20
+
+# Set number of retries of a Collab API call throttled (429), failed on the server (5xx) or on the connection
+CollabRetries = 5
+
+# Set base and maximum backoff (in seconds) between Collab retries when no Retry-After is given (jittered, doubling)
+CollabRetryBackoff = 1
+CollabRetryBackoffMax = 60
+
+# Set number of recordings per page requested from Collab for a course (API data source)
+RecordingsPageSize = 100
+
+# Set recording attributes requested from Collab for a course (API data source), '' for all attributes
+RecordingFields = 'id,name,duration,storageSize,created'
+
+# Set maximum number of idle DB connections kept open for reuse during the run (DB data source)
+DbPoolSize = 2
+
+# Set number of seconds a pooled DB connection can stay idle before it is checked (SELECT 1) on reuse
+DbHealthCheckAfter = 60
+
+# Set number of rows fetched at a time from the eligible recordings query (DB data source)
+DbFetchSize = 5000
+
+# Keep eligible recordings of each window in a local SQLite snapshot, read by previews, restarts and repeat runs
+# possible values: Yes or No
+DbSnapshot = 'Yes'
+
+# Set file of the eligible recordings snapshot
+DbSnapshotPath = './data/eligible_recordings.db'
+
+# Set number of hours after which the snapshot of a window is queried again from the DB
+DbSnapshotMaxAge = 24
+
+# Query the DB again for each window once in this run, replacing its snapshot (kept after a restart)
+# possible values: Yes or No
+DbSnapshotRefresh = 'No'
+
+# Set number of migrated recording ids (latest first) excluded from the DB feed, 0 for all of them
+# older ids are dropped from data/migrated_recordings.txt and found on Panopto by the duplicate check instead
+MigratedRecordingsKept = 500000
+
+# Set date range (yyyy-mm-dd) of a historic backfill run by the automatic run, '' for the daily run
+BackfillStartDate = ''
+BackfillEndDate = ''
+
+# Set number of days of each backfill shard (e.g. 1 for day shards, 7 for week shards)
+BackfillShardDays = 7
+
+# Set number of backfill shards processed at once (one process each, the spool quota is shared between them)
+BackfillConcurrency = 2
+
+# Set folder of the backfill shards (spool folder, checkpoint and summary of each shard)
+BackfillPath = './data/backfill/'
+
+# Set number of times a Panopto API call is retried (token refused 401, throttled 429, server error 500)
+# a forbidden call (403) is retried once, with a new token
+PanoptoRetries = 5
+
+# Set number of Collab contexts (courses) pages fetched at once when crawling courses (API data source)
+ContextCrawlConcurrency = 4
+
+# Set number of keep-alive connections pooled per host for Collab API and recording stream calls
+# (0 sizes the pool from DownloadConcurrency x DownloadSegments)
+HttpPoolSize = 0
+
+# Set timeouts (in seconds) for connecting to Collab / recording streams, and for each read from the socket
+HttpConnectTimeout = 10
+HttpReadTimeout = 120
+
+# Set number of seconds before expiry from which the shared Collab access token is refreshed
+# (refreshed in the background at twice this margin)
+CollabTokenRefreshMargin = 60
+
+# Set number of hours a private recording url issued by Collab is valid for (urls are issued when the transfer starts)
+PrivateUrlValidHours = 1
+
+# Set number of seconds before expiry from which a cached private recording url is issued again
+PrivateUrlRefreshMargin = 300
+
+# Set folder where recordings are downloaded (spooled) before upload, e.g. on a faster scratch disk
+SpoolPath = './downloads/'
+
+# Set maximum size (in bytes) of the recordings held in the spool folder at once (0 for no quota)
+# downloads wait for space to be released by uploaded or failed recordings
+SpoolQuota = 50 * 1024 * 1024 * 1024
+
+# Set disk space (in bytes) always kept free on the spool volume
+SpoolHeadroom = 1024 * 1024 * 1024
+
+# Set maximum time (in seconds) a download waits for spool space, after which it counts as failed
+SpoolMaxWait = 2 * 60 * 60
@@ -4,12 +4,14 @@ from time import sleep
 from config import globalConfig
 from src.models import Utilities as Utils
 from src.controllers import ApplicationController as App
+from src.controllers import BackfillController as Backfill
 from src.views import Logger
 from src.models import Emails
 import pid
 import os
 import traceback
 import psutil
+import sys
 
 
 is_active = True
@@ -86,14 +88,25 @@ def auto_run_program():
     # This setting should be used for fully automated daily batches migration
     start_date = Utils.set_search_start_date(1)
     end_date = Utils.set_search_end_date(0)
-    ## SETTING 2
-    # This setting should only be used for historic batches migration (to allow restart to work properly)
-    # start_date = "2022-10-03"
-    # end_date = "2022-10-02"
     course_filter = ""
+    ## SETTING 2
+    # Historic batches migration: globalConfig.BackfillStartDate -> globalConfig.BackfillEndDate,
+    # split into shards run in parallel (shards already done are skipped on restart or on the next run)
+    if globalConfig.BackfillStartDate != '' and globalConfig.BackfillEndDate != '':
+        Backfill.run_backfill(globalConfig.BackfillStartDate, globalConfig.BackfillEndDate, course_filter)
+        Utils.run_shutdown_hooks()
+        os._exit(0)
     App.run_application(start_date, end_date, course_filter)
 
 
+def backfill_shard_program(start_date, end_date, course_filter):
+    """backfill shard run in its own process by the backfill run:
+        runscript.py --backfill-shard <start date> <end date> <course filter>
+    """
+    print(f"\n >> Backfill shard initiated: {start_date} -> {end_date} \n")
+    Backfill.run_shard(start_date, end_date, course_filter)
+
+
 if __name__ == "__main__":
     global LOGGER
     try:
@@ -104,6 +117,11 @@ if __name__ == "__main__":
             "\n=========================================================================================================" 
             )
         
+        # backfill shards run alongside the backfill run holding the pid file
+        if len(sys.argv) > 1 and sys.argv[1] == "--backfill-shard":
+            backfill_shard_program(*sys.argv[2:5])
+            sys.exit(0)
+
         pidfile = None
 
         userhome = os.path.expanduser('~')
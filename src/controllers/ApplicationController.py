@@ -11,14 +11,18 @@ from src.models.Uploads import Uploads
 from src.views import Reports
 from src.models import Emails
 from src.models import Blacklist
+from src.models import Spool
+from src.models import CollabThrottle
 import time
 import traceback
 import csv
+import queue
+import threading
 from config import globalConfig
 from config import Config
 
 BASE = os.getcwd()
-LOGS = Utilities.create_dir_if_not_exists(f"{BASE}/.logs")
+LOGS = Utilities.create_dir_if_not_exists(f"{Logger.run_dir()}/.logs")
 LOGGER = Logger.init_logger(__name__)
 WEBSERVICE = Ws.WebService()
 DBFEED = Dbfeed.DatabaseFeed()
@@ -99,21 +103,20 @@ def run_preview(start_date: str, end_date: str, course_filter):
                 count = len(rec_id_list)
                 totalcount += count
                 print(f"\n## {count} Recordings expected for  {label}: ")
-                for rec_id in rec_id_list:
-                    rec = WEBSERVICE.get_recording_db(rec_id)
-                    if rec.get('errorKey') == 'resource_not_found':  # db lag - case when deleted on collab
-                        print(f"  + <recording not found on collab>")
-                    else: 
-                        filename = Utilities.return_download_filename_db(label, rec_id, rec, ".mp4")
-                        print(f"  + {filename}")             
+                recs, not_found = WEBSERVICE.get_recordings_batch_db(rec_id_list)
+                for rec in recs:
+                    filename = Utilities.return_download_filename_db(label, rec["id"], rec, ".mp4")
+                    print(f"  + {filename}")
+                for rec_id in not_found:  # db lag - case when deleted on collab
+                    print(f"  + <recording not found on collab> {rec_id}")
             print(f"\n\n{totalcount} Recordings expected for the selected period")
     else:
         recordings_found = []
         totalcount = 0
         for id,label,name in id_label_names:
-            recordings_found = Downloads.get_recordings_list_by_id(id, g_start_date, g_end_date)
+            recordings_found, failed_pre_downloads = Downloads.get_recordings_list_by_id(id, g_start_date, g_end_date)
             # Filter courses with recordings
-            if recordings_found == [] or recordings_found is None:
+            if recordings_found == []:
                 print(f"\n## No Recordings found for: {label}")
             else:
                 courses_with_recordings.append([label,name])
@@ -152,7 +155,7 @@ def run_preview(start_date: str, end_date: str, course_filter):
     print("#######################")
     print("")
 
-    downloads_list = Utilities.get_downloads_list(f"{BASE}/downloads")
+    downloads_list = Utilities.get_downloads_list(Spool.path())
     folderId_downloads = Utilities.get_folder_download_matches(
         courseLabels_folderIds, downloads_list
     )
@@ -179,7 +182,12 @@ def run_preview(start_date: str, end_date: str, course_filter):
 
 
 ##### ACTUAL RUN OPTION
-def run_application(start_date: str, end_date: str, course_filter):
+def run_application(start_date: str, end_date: str, course_filter, summary_path: str = ''):
+    """Actual run: downloads eligible recordings of the period, uploads them to Panopto
+    Args:
+        summary_path (str): backfill shard only - file the run summary is written to (the shard checkpoint),
+            no email notification (sent by the backfill run for all shards)
+    """
     global g_start_date
     g_start_date = start_date
     global g_end_date
@@ -193,7 +201,7 @@ def run_application(start_date: str, end_date: str, course_filter):
         
         Utilities.pre_run_reset()
 
-        def upload_eligible_recordings(label_name: list, eligible_recordings: list):
+        def upload_eligible_recordings(label_name: list, eligible_recordings: list, failed_pre_downloads: list, failed_downloads: list):
             for failed in failed_pre_downloads:
                     failed_downloads_list.append(failed)
             if eligible_recordings != []:
@@ -229,12 +237,32 @@ def run_application(start_date: str, end_date: str, course_filter):
         label_names = ()
         id_label_names, label_names = apply_data_source_option()
 
-        if globalConfig.DataSource == 'DB':
-            for label,name in label_names:
-                if globalConfig.ScheduledRun == 'Yes' and Utilities.time_of_day() >= globalConfig.ControlledStopTime:
-                    set_controlled_stop()
-                    break 
+        # PIPELINE: courses are downloaded by the download stage and queued for the upload stage,
+        # so the next courses download while earlier ones upload and process on Panopto.
+        # The queue size bounds the downloaded courses waiting for upload (back-pressure on local disk use)
+        transfer_queue = queue.Queue(maxsize=globalConfig.PipelineQueueSize)
+        stop_pipeline = threading.Event()
+        pipeline_errors = []
+
+        def queue_course(item):
+            while not stop_pipeline.is_set():
+                try:
+                    transfer_queue.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def download_stage():
+            try:
+                if globalConfig.DataSource == 'DB':
+                    courses = [(label, label, name) for label, name in label_names]
                 else:
+                    courses = id_label_names
+                for id, label, name in courses:
+                    if g_controlled_stop is True or (globalConfig.ScheduledRun == 'Yes' and Utilities.time_of_day() >= globalConfig.ControlledStopTime):
+                        set_controlled_stop()
+                        break 
                     print(f"--------------------------------------------------------------------------------------------")
                     print(f"COLLAB:SEARCHING -- {label}")
                     print(f"--------------------------------------------------------------------------------------------")
@@ -242,19 +270,44 @@ def run_application(start_date: str, end_date: str, course_filter):
                     "\n--------------------------------------------------------------------------------------------" +
                     f"\nCOLLAB:SEARCHING -- {label}" +
                     "\n--------------------------------------------------------------------------------------------")
-                    eligible_recordings, failed_pre_downloads, failed_downloads = download_from_collab(label = label)
-                    upload_eligible_recordings([label,name], eligible_recordings)            
-        else:
-            for id, label, name in id_label_names:
-                    print(f"--------------------------------------------------------------------------------------------")
-                    print(f"COLLAB:SEARCHING -- {label}")
-                    print(f"--------------------------------------------------------------------------------------------")
-                    LOGGER.debug(
-                    "\n--------------------------------------------------------------------------------------------" +
-                    f"\nCOLLAB:SEARCHING -- {label}" +
-                    "\n--------------------------------------------------------------------------------------------")
-                    eligible_recordings, failed_downloads = download_from_collab(course_id_labels = {id:label})
-                    upload_eligible_recordings([label,name], eligible_recordings)
+                    if globalConfig.DataSource == 'DB':
+                        eligible_recordings, failed_pre_downloads, failed_downloads = download_from_collab(label = label)
+                    else:
+                        eligible_recordings, failed_pre_downloads, failed_downloads = download_from_collab(course_id_labels = {id:label})
+                    if not queue_course(([label,name], eligible_recordings, failed_pre_downloads, failed_downloads)):
+                        break
+            except Exception as e:
+                pipeline_errors.append(e)
+                LOGGER.error(traceback.format_exc())
+                stop_pipeline.set()
+            finally:
+                for _ in range(globalConfig.PipelineUploadWorkers):
+                    queue_course(None)
+
+        def upload_stage():
+            while not stop_pipeline.is_set():
+                try:
+                    item = transfer_queue.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    break
+                try:
+                    upload_eligible_recordings(*item)
+                except Exception as e:
+                    pipeline_errors.append(e)
+                    LOGGER.error(traceback.format_exc())
+                    stop_pipeline.set()
+
+        stages = [threading.Thread(target=download_stage, name="download-stage")]
+        for i in range(globalConfig.PipelineUploadWorkers):
+            stages.append(threading.Thread(target=upload_stage, name=f"upload-stage-{i}"))
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+        if pipeline_errors:
+            raise pipeline_errors[0]
 
         successful_downloads_count = 0
         public_downloads_count, private_downloads_count = Reports.get_downloads_totals()
@@ -275,7 +328,8 @@ def run_application(start_date: str, end_date: str, course_filter):
         f"\n\nfailed_uploads_list: {len(failed_uploads_list)} - {failed_uploads_list}" +
         f"\n\nalready_on_ppto_list: {len(already_on_ppto_list)} - {already_on_ppto_list}" +
         f"\n\nundiscovered_uploads_list: {len(undiscovered_uploads_list)} - {undiscovered_uploads_list}" +
-        f"\n\nfailed_ppto_deletions_list: {len(failed_ppto_deletions_list)} - {failed_ppto_deletions_list}")
+        f"\n\nfailed_ppto_deletions_list: {len(failed_ppto_deletions_list)} - {failed_ppto_deletions_list}" +
+        f"\n\ncollab_api_calls: {CollabThrottle.counters()}")
         print(log_info_msg)
         LOGGER.info(log_info_msg)
 
@@ -317,9 +371,24 @@ def run_application(start_date: str, end_date: str, course_filter):
 
         log_info_msg += rediscover_msg
         log_info_msg += redelete_msg
-        
+
+        if summary_path != '':
+            Utilities.save_run_summary(summary_path, {
+                "start_date": g_start_date,
+                "end_date": g_end_date,
+                "controlled_stop": g_controlled_stop,
+                "successful_downloads_count": successful_downloads_count,
+                "successful_uploads_list": successful_uploads_list,
+                "failed_downloads_list": failed_downloads_list,
+                "failed_uploads_list": failed_uploads_list,
+                "already_on_ppto_list": already_on_ppto_list,
+                "undiscovered_uploads_list": undiscovered_uploads_list_final_2,
+                "failed_ppto_deletions_list": failed_ppto_deletions_list_final_2,
+                "collab_api_calls": CollabThrottle.counters(),
+            })
+
        # Send email notification about run outcome
-        if globalConfig.EmailNotification == 'Yes':
+        if globalConfig.EmailNotification == 'Yes' and summary_path == '':
             message = Emails.create_info_email(log_info_msg, g_controlled_stop)
             # email = Emails.attach_notification_excel(
             #     message, failed_downloads_list, failed_uploads_list, undiscovered_uploads_list_final_2,
@@ -334,6 +403,8 @@ def run_application(start_date: str, end_date: str, course_filter):
 
         if done:
             sleep(10)
+            # os._exit skips atexit: release connections first
+            Utilities.run_shutdown_hooks()
             os._exit(0)
 
     except Exception as e:
@@ -383,6 +454,8 @@ def get_course_pairs_db():
     """
     LOGGER.debug(f"Searching database for recordings from date: {g_start_date} to date: {g_end_date}")
 
+    # blacklisted courses and recordings migrated by previous runs are left out of the DB feed
+    DBFEED.set_exclusions(Blacklist.get_blacklisted_courses(), Blacklist.get_migrated_recordings())
     label_names = DBFEED.get_distinct_label_names_db(g_start_date, g_end_date, g_course_filter)
     
     return label_names
@@ -400,7 +473,7 @@ def get_course_pairs_api():
     # ENTER FILTER FOR SEARCH ON COURSE NAME
     # Returns the course id:label pairs from the api
     # NOTE This option will return all courses if course year filter (uow adhoc filter) is blank
-    course_pairs = WEBSERVICE.courses_data_from_collab(g_course_filter) # Search term on name
+    course_pairs = WEBSERVICE.courses_data_from_collab(g_course_filter) # Search term on name, streamed page by page
     id_label_pairs, courses_without_labels = Courses.get_id_label_pairs(course_pairs)
 
     # First filter excluding the labels that are blacklisted
@@ -463,7 +536,9 @@ def download_from_collab(course_id_labels = {}, label = ''):
         else:
             for label, name, rec_id_list in course_recordings_db:
                 LOGGER.info(f"{len(rec_id_list)} Recordings found for {label}")
-                rec_objects = WEBSERVICE.get_recordings_db(rec_id_list)
+                rec_objects, not_found = WEBSERVICE.get_recordings_batch_db(rec_id_list)
+                if not_found:
+                    LOGGER.info(f"{len(not_found)} Recordings not found on Collab for {label}: {not_found}")
                 if len(rec_objects) != 0:
                     # getting list of downloadable recordings                    
                     recordings_found, failed_pre_downloads =  Downloads.list_of_recordings_db(rec_objects)
@@ -480,17 +555,18 @@ def download_from_collab(course_id_labels = {}, label = ''):
         for id, label in course_id_labels.items():
             recordings_found, failed_pre_downloads = Downloads.get_recordings_list_by_id(id, g_start_date, g_end_date)
 
-            if recordings_found is None:
+            if recordings_found == []:
                 LOGGER.info(f"No recordings found for: {label}")
             else:
                 LOGGER.info(f"{len(recordings_found)} Recordings found for {label}")
+                failed_downloads, failed_download_ids = Downloads.get_recordings_for_course(recordings_found, label)
                 [
                     eligible_recordings.append(
                         {r["recording_id"]: r.get("created")}
                     )
                     for r in recordings_found
+                    if r["recording_id"] not in failed_download_ids
                 ]
-                failed_downloads = Downloads.get_recordings_for_course(recordings_found, label)
 
     Reports.generate_download_reports()
 
@@ -544,6 +620,8 @@ def upload_to_panopto(course_label_name: list, eligible_recordings: list):
 
     LOGGER.debug("PANOPTO:SEARCHING")
     print("Getting PPTO folder ID for the upload")
+    course_label = course_label_name[0]
+    Utilities.set_current_course_label(course_label)
     uploader = Uploads()
     course_label_name_list = []
     course_label_name_list.append(course_label_name)
@@ -551,11 +629,18 @@ def upload_to_panopto(course_label_name: list, eligible_recordings: list):
         course_label_name_list
     )
 
-    Blacklist.clean_downloads()
+    Blacklist.clean_downloads(course_label)
 
-    downloads_list = Utilities.get_downloads_list(f"{BASE}/downloads") # mp4 file paths
+    # only this course's downloads: later courses may already be downloaded by the pipeline
+    downloads_list = [
+        download for download in Utilities.get_downloads_list(Spool.path()) # mp4 file paths
+        if os.path.basename(download).startswith(f"{Utilities.clean_name(course_label)}#")
+    ]
+    courseLabel_folderId = {
+        label: folder_id for label, folder_id in courseLabels_folderIds.items() if label == course_label
+    }
     folderId_downloads = Utilities.get_folder_download_matches(
-        courseLabels_folderIds, downloads_list
+        courseLabel_folderId, downloads_list
     )
 
     already_on_ppto, successful_uploads, undiscovered_sessions, unrenamed_failed_ppto_deletions, failed_uploads, failed_ppto_deletions = [], [], [], [], [], []
@@ -572,6 +657,11 @@ def upload_to_panopto(course_label_name: list, eligible_recordings: list):
             downloads, folder_id, check = 'Duplicate'
         )        
         print('already_on_ppto: ', already_on_ppto) # list of dictionaries with Name:Id
+        # renamed on PPTO by previous runs: excluded from the DB feed of later runs
+        unrenamed_names = [name for rec in unrenamed_on_ppto for name in rec.keys()]
+        Blacklist.record_migrated_recordings(
+            [rec for rec in downloads if rec not in recs_to_upload and os.path.basename(rec) not in unrenamed_names]
+        )
 
         # If there are unrenamed recordings (undiscovered from previous runs)
         # - skip upload + discover
@@ -583,6 +673,7 @@ def upload_to_panopto(course_label_name: list, eligible_recordings: list):
             if len (unrenamed_successfulUploads) > 0:
                 rename(unrenamed_successfulUploads)
                 delete_bb(unrenamed_successfulUploads)
+                Blacklist.record_migrated_recordings([name for rec in unrenamed_successfulUploads for name in rec.keys()])
 
             if len (unrenamed_failedUploads) > 0:
                 unrenamed_failed_ppto_deletions = uploader.delete_unprocessed_recordings_on_panopto(
@@ -623,6 +714,7 @@ def upload_to_panopto(course_label_name: list, eligible_recordings: list):
             if len(discovered_sessions) > 0:
                 rename(discovered_sessions)
                 delete_bb(discovered_sessions)
+                Blacklist.record_migrated_recordings([name for rec in discovered_sessions for name in rec.keys()])
 
         print("Deleting Local recording(s)")
         LOGGER.debug("Deleting Local recording(s)")
@@ -631,9 +723,15 @@ def upload_to_panopto(course_label_name: list, eligible_recordings: list):
             print("Local deleted")
             LOGGER.debug("Local deleted")
         else:
+            # recordings kept on disk by choice are no longer counted in the spool quota
+            for download in downloads:
+                Spool.release(os.path.basename(download))
             print("No Local delete")
             LOGGER.debug("No Local delete")
 
+    # failed uploads (kept on disk) and downloads without a matched folder are no longer counted in the spool quota
+    for download in downloads_list:
+        Spool.release(os.path.basename(download))
 
     return failed_uploads, undiscovered_sessions, successful_uploads, already_on_ppto, unrenamed_failed_ppto_deletions, failed_ppto_deletions
 
@@ -0,0 +1,191 @@
+import os
+import sys
+import time
+import datetime
+import subprocess
+from src.views import Logger
+from src.models import Utilities
+from src.models import Emails
+from src.controllers import ApplicationController as App
+from config import globalConfig
+
+BASE = os.getcwd()
+LOGGER = Logger.init_logger(__name__)
+
+# Time (in seconds) between checks of the running shards
+POLL_INTERVAL = 30
+
+# lists of the end of run summary, combined across shards
+SUMMARY_LISTS = [
+    "successful_uploads_list",
+    "failed_downloads_list",
+    "failed_uploads_list",
+    "already_on_ppto_list",
+    "undiscovered_uploads_list",
+    "failed_ppto_deletions_list",
+]
+
+
+def get_shards(start_date: str, end_date: str, days: int):
+    """Splits the backfill period into consecutive shards of {days} days (the last one may be shorter)
+    Args:
+        start_date (str): "%Y-%m-%d"
+        end_date (str): "%Y-%m-%d"
+    Returns:
+        list of (start_date, end_date) tuples, in "%Y-%m-%d" format
+    """
+    start = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.datetime.strptime(end_date, "%Y-%m-%d")
+    step = datetime.timedelta(days=max(1, int(days)))
+    shards = []
+    while start < end:
+        shard_end = min(start + step, end)
+        shards.append((start.strftime("%Y-%m-%d"), shard_end.strftime("%Y-%m-%d")))
+        start = shard_end
+    return shards
+
+
+def get_shard_path(start_date: str, end_date: str):
+    """Returns folder of the shard (its spool folder, summary, logs, reports and lookup file), with trailing separator
+    """
+    return os.path.join(globalConfig.BackfillPath, f"{start_date}_{end_date}", "")
+
+
+def get_shard_summary_path(start_date: str, end_date: str):
+    return os.path.join(get_shard_path(start_date, end_date), "summary.json")
+
+
+def is_shard_done(start_date: str, end_date: str):
+    """True if the shard completed in a previous or current backfill run (checkpoint),
+        False if it never ran, crashed or stopped at the controlled stop time
+    """
+    summary = Utilities.load_run_summary(get_shard_summary_path(start_date, end_date))
+    return summary is not None and summary.get("controlled_stop") is not True
+
+
+def is_stop_time():
+    return globalConfig.ScheduledRun == 'Yes' and Utilities.time_of_day() >= globalConfig.ControlledStopTime
+
+
+def start_shard(start_date: str, end_date: str, course_filter: str):
+    """Starts the shard in its own process (runscript.py --backfill-shard), restarted by itself after a crash
+    Returns:
+        subprocess.Popen
+    """
+    LOGGER.info(f"Starting backfill shard {start_date} -> {end_date}")
+    print(f"Backfill shard started: {start_date} -> {end_date}")
+    env = dict(os.environ)
+    env.pop(Utilities.RESTART_ENV, None)
+    # the shard's logs, reports and folder lookup file are kept in the shard folder
+    env[Logger.RUN_DIR_ENV] = os.path.abspath(get_shard_path(start_date, end_date))
+    return subprocess.Popen(
+        [sys.executable, f"{BASE}/runscript.py", "--backfill-shard", start_date, end_date, course_filter],
+        cwd=BASE, env=env,
+    )
+
+
+##### BACKFILL SHARD (child process)
+def run_shard(start_date: str, end_date: str, course_filter: str):
+    """Actual run of one shard: recordings are spooled to the shard folder (share of globalConfig.SpoolQuota),
+        the run summary is saved as the shard checkpoint
+    """
+    globalConfig.SpoolPath = os.path.join(get_shard_path(start_date, end_date), "downloads", "")
+    if globalConfig.SpoolQuota:
+        globalConfig.SpoolQuota = globalConfig.SpoolQuota // max(1, globalConfig.BackfillConcurrency)
+    App.run_application(start_date, end_date, course_filter, summary_path=get_shard_summary_path(start_date, end_date))
+
+
+##### BACKFILL RUN OPTION
+def run_backfill(start_date: str, end_date: str, course_filter: str):
+    """Historic migration of a long period: the period is split into shards of globalConfig.BackfillShardDays days,
+        processed globalConfig.BackfillConcurrency at a time (one process each).
+        Shards completed by a previous backfill run are skipped, so a stopped or crashed backfill
+        carries on from where it stopped on the next run
+    Args:
+        start_date (str): "%Y-%m-%d"
+        end_date (str): "%Y-%m-%d"
+    Returns:
+        dict: combined summary of the shards
+    """
+    LOGGER.info(f"Starting BACKFILL -- from {start_date} until {end_date}")
+    print(f"\n\nBackfill - for period: {start_date} -> {end_date}")
+
+    shards = get_shards(start_date, end_date, globalConfig.BackfillShardDays)
+    pending = [shard for shard in shards if not is_shard_done(*shard)]
+    msg = f"Backfill shards: {len(shards)} - {len(shards) - len(pending)} already done"
+    print(msg)
+    LOGGER.info(msg)
+
+    # reset of the backfill run's own files, each shard resets its own folder
+    Utilities.pre_run_reset()
+
+    running = {}
+
+    def stop_running_shards():
+        # parent restarting or exiting: the shards are started again (resuming their downloads) by the next run
+        for process in running.values():
+            if process.poll() is None:
+                process.terminate()
+
+    Utilities.register_shutdown_hook(stop_running_shards)
+    while pending or running:
+        while pending and len(running) < max(1, globalConfig.BackfillConcurrency) and not is_stop_time():
+            shard = pending.pop(0)
+            running[shard] = start_shard(*shard, course_filter)
+        if not running:
+            break
+        time.sleep(POLL_INTERVAL)
+        for shard, process in list(running.items()):
+            if process.poll() is not None:
+                del running[shard]
+                msg = f"Backfill shard {shard[0]} -> {shard[1]} exited ({process.returncode}) - done: {is_shard_done(*shard)}"
+                print(msg)
+                LOGGER.info(msg)
+
+    summary = combine_shard_summaries(shards)
+    Utilities.save_run_summary(os.path.join(globalConfig.BackfillPath, "summary.json"), summary)
+
+    log_info_msg = ''
+    if summary["shards_pending"]:
+        # stopped at the controlled stop time or crashed: carried on by the next backfill run
+        log_info_msg = f"\n--- BACKFILL INCOMPLETE ---"
+    log_info_msg += (f"\n--- END OF BACKFILL SUMMARY ---" +
+    f"\n----------------------------------------" +
+    f"\nperiod: {start_date} -> {end_date}" +
+    f"\n\nshards done: {len(summary['shards_done'])} - {summary['shards_done']}" +
+    f"\n\nshards pending: {len(summary['shards_pending'])} - {summary['shards_pending']}" +
+    f"\n\nsuccessful downloads count: {summary['successful_downloads_count']}")
+    for name in SUMMARY_LISTS:
+        log_info_msg += f"\n\n{name}: {len(summary[name])} - {summary[name]}"
+    print(log_info_msg)
+    LOGGER.info(log_info_msg)
+
+    if globalConfig.EmailNotification == 'Yes':
+        message = Emails.create_info_email(log_info_msg, summary["shards_pending"] != [])
+        Emails.send_info_email(message)
+
+    LOGGER.info("BACKFILL COMPLETE")
+    return summary
+
+
+def combine_shard_summaries(shards: list):
+    """Adds up the summaries of the shards (saved by each shard once complete)
+    Returns:
+        dict: counts and lists of all shards, shards done and pending ("start_date_end_date")
+    """
+    combined = {"shards_done": [], "shards_pending": [], "successful_downloads_count": 0}
+    for name in SUMMARY_LISTS:
+        combined[name] = []
+    for start_date, end_date in shards:
+        summary = Utilities.load_run_summary(get_shard_summary_path(start_date, end_date))
+        if summary is None:
+            combined["shards_pending"].append(f"{start_date}_{end_date}")
+            continue
+        if summary.get("controlled_stop") is True:
+            combined["shards_pending"].append(f"{start_date}_{end_date}")
+        else:
+            combined["shards_done"].append(f"{start_date}_{end_date}")
+        combined["successful_downloads_count"] += summary.get("successful_downloads_count", 0)
+        for name in SUMMARY_LISTS:
+            combined[name].extend(summary.get(name, []))
+    return combined
@@ -1,10 +1,16 @@
 import os
+import threading
 from src.models import Utilities as Utils
+from src.models import Spool
 from src.views import Logger
+from config import globalConfig
 
 
 BASE = os.getcwd()
 LOGGER = Logger.init_logger(__name__)
+# recording ids already uploaded to Panopto, excluded from the DB feed of later runs
+MIGRATED_RECORDINGS_FILE = f"{BASE}/data/migrated_recordings.txt"
+g_migrated_lock = threading.Lock()
 
 
 def get_blacklisted_courses():
@@ -15,10 +21,20 @@ def get_blacklisted_courses():
     return blacklisted_courses
 
 
-def clean_downloads():
-    LOGGER.debug("")
+def clean_downloads(course_label: str = ''):
+    """Deletes downloads of blacklisted courses from the spool folder
+    Args:
+        course_label (str): only the downloads of this course ('' for all downloads):
+            the upload of a course must not delete downloads of courses still queued for upload
+    """
+    LOGGER.debug(f"{course_label}")
     blacklisted_courses = get_blacklisted_courses()
-    downloads_list = Utils.get_downloads_list(f"{BASE}/downloads")
+    downloads_list = Utils.get_downloads_list(Spool.path())
+    if course_label != '':
+        downloads_list = [
+            download for download in downloads_list
+            if os.path.basename(download).startswith(f"{Utils.clean_name(course_label)}#")
+        ]
 
     to_delete = []
     for download in downloads_list:
@@ -28,7 +44,47 @@ def clean_downloads():
 
     for blacklisted in to_delete:
         LOGGER.debug(f"Deleting {os.path.basename(blacklisted)}")
-        os.unlink(blacklisted)
+        Utils.remove_download(blacklisted)
+
+
+def get_migrated_recordings():
+    """Returns set of recording ids already migrated to Panopto (by previous runs), the latest
+        globalConfig.MigratedRecordingsKept of them. Older ids are not excluded from the DB feed any more,
+        they are found on Panopto by the duplicate check before upload.
+        The file is compacted (duplicates and older ids dropped) when not read by a backfill shard,
+        shards append to it in parallel
+    """
+    with g_migrated_lock:
+        if not os.path.isfile(MIGRATED_RECORDINGS_FILE):
+            return set()
+        with open(MIGRATED_RECORDINGS_FILE, "r") as f:
+            lines = [line for line in f.read().splitlines() if line]
+        # latest occurrence of each id, oldest first
+        ordered = list(reversed(list(dict.fromkeys(reversed(lines)))))
+        kept = ordered[-globalConfig.MigratedRecordingsKept:] if globalConfig.MigratedRecordingsKept else ordered
+        if len(kept) < len(lines) and Logger.RUN_DIR_ENV not in os.environ:
+            tmp_file = f"{MIGRATED_RECORDINGS_FILE}.{os.getpid()}.tmp"
+            with open(tmp_file, "w") as f:
+                f.writelines(f"{rec_id}\n" for rec_id in kept)
+            os.replace(tmp_file, MIGRATED_RECORDINGS_FILE)
+            LOGGER.info(f"Migrated recordings compacted: {len(lines)} -> {len(kept)} ids")
+    LOGGER.debug(f"{len(kept)} migrated recordings")
+    return set(kept)
+
+
+def record_migrated_recordings(filenames: list):
+    """Adds recordings found on Panopto (uploaded and discovered, or already there) to the migrated recordings
+    Args:
+        filenames (list): recording file names or paths (course_label#recording_id#name.mp4)
+    """
+    rec_ids = [Utils.recording_id_from_filename(filename) for filename in filenames]
+    rec_ids = [rec_id for rec_id in rec_ids if rec_id]
+    if not rec_ids:
+        return
+    with g_migrated_lock:
+        with open(MIGRATED_RECORDINGS_FILE, "a") as f:
+            f.writelines(f"{rec_id}\n" for rec_id in rec_ids)
+    LOGGER.debug(f"Migrated: {rec_ids}")
 
 
 # TODO
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import aiohttp
+from config import Config as Conf
+from config import globalConfig
+from src.models import CollabJWT as Jwt
+from src.models import CollabThrottle as Throttle
+from src.views import Logger
+
+LOGGER = Logger.init_logger(__name__)
+
+g_loop = None
+g_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """Returns the event loop all async Collab calls run on (started in a daemon thread on first call)
+    """
+    global g_loop
+    with g_loop_lock:
+        if g_loop is None:
+            g_loop = asyncio.new_event_loop()
+            threading.Thread(target=g_loop.run_forever, name="collab-async", daemon=True).start()
+        return g_loop
+
+
+def run(coroutine):
+    """Runs coroutine on the Collab event loop and waits for its result (sync facade)
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop()).result()
+
+
+class AsyncWebService:
+    """Async Collab API client: same operations as CollabWebService.WebService / CollabSessions,
+        on one event loop and one aiohttp connection pool (globalConfig.AsyncCollabConcurrency connections).
+        The access token is shared with WebService through the process wide token manager.
+    """
+    def __init__(self):
+        LOGGER.debug("")
+        self.collab_key = Conf.credentials["collab_key"]
+        self.collab_secret = Conf.credentials["collab_secret"]
+        self.collab_domain = Conf.credentials["collab_base_url"]
+        self.cert = True if Conf.credentials["verify_certs"] == "True" else False
+        self.session = None
+
+    async def get_session(self):
+        # created on the event loop, reused by every call
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=globalConfig.AsyncCollabConcurrency, ssl=None if self.cert else False)
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=globalConfig.HttpConnectTimeout, sock_read=globalConfig.HttpReadTimeout
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self.session
+
+    async def get_headers(self):
+        manager = Jwt.get_token_manager(self.collab_domain, self.collab_key, self.collab_secret, self.cert)
+        # token is cached by the manager: only blocks the executor thread when it is requested from Collab
+        token = await asyncio.get_event_loop().run_in_executor(None, manager.get_token)
+        return {"Authorization": "Bearer " + token, "Content-Type": "application/json", "Accept": "application/json"}
+
+    async def request(self, method, path, **kwargs):
+        """Returns: (status code, parsed json or None)
+        """
+        session = await self.get_session()
+        url = f"https://{self.collab_domain}{path}"
+        # shared Collab rate limiter and retry policy (429 / 5xx)
+        return await Throttle.request_async(session, method, url, headers=await self.get_headers(), **kwargs)
+
+    async def get_recordings(self, course_id, start_time):
+        status, data = await self.request("GET", "/recordings", params={"contextId": course_id, "startTime": str(start_time)})
+        return data if status == 200 else None
+
+    async def get_recording_object_db(self, recording_id):
+        """returns rec json dict
+        """
+        status, data = await self.request("GET", f"/recordings/{recording_id}")
+        return data if data is not None else {}
+
+    async def get_public_recording_data(self, recording_id):
+        """Public recording: recording json data (200), private recording: None (403)
+        """
+        status, data = await self.request("GET", f"/recordings/{recording_id}/data")
+        if status != 200:
+            LOGGER.debug(f"{status} response for recording data -- {recording_id}")
+            return None
+        return data
+
+    async def get_private_recording_url(self, recording_id, valid_hours=1):
+        status, data = await self.request(
+            "GET", f"/recordings/{recording_id}/url", params={"validHours": valid_hours, "disposition": "download"}
+        )
+        return (data or {}).get("url")
+
+    async def delete_recording(self, recording_id):
+        """Returns: True, False
+        """
+        try:
+            status, data = await self.request("DELETE", f"/recordings/{recording_id}")
+        except aiohttp.ClientError as e:
+            LOGGER.error(str(e))
+            return False
+        if status == 404:
+            LOGGER.warning(f"404 => {recording_id} not found on Collab.")
+        return status in (200, 404)
+
+    async def gather(self, operation, recording_ids):
+        """Runs operation for every recording id concurrently
+        Returns:
+            list of results, in recording_ids order
+        """
+        return await asyncio.gather(*[operation(recording_id) for recording_id in recording_ids])
+
+
+g_async_webservice = None
+g_async_webservice_lock = threading.Lock()
+
+
+def get_async_webservice():
+    """Returns the process wide AsyncWebService
+    """
+    global g_async_webservice
+    with g_async_webservice_lock:
+        if g_async_webservice is None:
+            g_async_webservice = AsyncWebService()
+        return g_async_webservice
@@ -5,8 +5,12 @@ import datetime
 import json
 from cachetools import TTLCache
 from src.models import Utilities
+from src.models import CollabThrottle as Throttle
 from src.views import Logger
 import sys
+import time
+import threading
+from config import globalConfig
 
 LOGGER = Logger.init_logger(__name__)
 
@@ -26,6 +30,7 @@ class CollabJWT:
         self.payload = {"grant_type": self.grant_type, "assertion": self.assertion}
         self.verify_cert = cert
         self.jcache = None
+        self.expires_in = None
 
     def get_key(self):
         return self.key
@@ -51,16 +56,101 @@ class CollabJWT:
     def create_session(self):
         try:
             endpoint = "https://" + self.domain + "/token"
-            r = requests.post(
+            r = Throttle.post(
                 endpoint, data=self.payload, auth=(self.key, self.secret), verify=self.cert
             )
 
             if r.status_code == 200:
                 json_data = json.loads(r.text)
+                self.expires_in = json_data["expires_in"]
                 self.jcache = TTLCache(maxsize=1, ttl=json_data["expires_in"])
                 token = self.jcache["jwtoken"] = json_data["access_token"]
                 return token
             else:
                 r.raise_for_status()           
         except requests.exceptions.HTTPError as e:
-            raise e
\ No newline at end of file
+            raise e
+
+
+class CollabTokenManager:
+    """Process wide Collab access token, shared by all threads.
+        The token is reused until globalConfig.CollabTokenRefreshMargin seconds before it expires
+        and refreshed in the background by then, so API calls don't wait for /token.
+        Each refresh signs a new JWT assertion (CollabJWT) as assertions are short lived.
+    """
+    def __init__(self, domain, key, secret, cert):
+        LOGGER.debug("")
+        self.domain = domain
+        self.key = key
+        self.secret = secret
+        self.cert = cert
+        self.token = None
+        self.expires_at = 0
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def get_token(self):
+        with self.lock:
+            if self.token is None or time.monotonic() >= self.expires_at - globalConfig.CollabTokenRefreshMargin:
+                self.__refresh()
+            return self.token
+
+    def invalidate(self, refused_token=None):
+        """Discards the token (e.g. rejected by Collab), the next get_token requests a new one.
+            Given the refused token, only discarded if it is still the current one:
+            calls refused with the same token at once only refresh it once
+        """
+        with self.lock:
+            if refused_token is not None and self.token != refused_token:
+                return
+            self.token = None
+            self.__cancel_timer()
+
+    def __refresh(self):
+        requested = time.monotonic()
+        jsession = CollabJWT(self.domain, self.key, self.secret, self.cert)
+        token = jsession.create_session()
+        if token is None:
+            raise requests.exceptions.HTTPError("No Collab access token received")
+        self.token = token
+        self.expires_at = requested + jsession.expires_in
+        LOGGER.debug(f"Collab token refreshed, expires in {jsession.expires_in} seconds")
+        self.__schedule_refresh(jsession.expires_in)
+
+    def __schedule_refresh(self, expires_in):
+        self.__cancel_timer()
+        delay = expires_in - 2 * globalConfig.CollabTokenRefreshMargin
+        if delay <= 0:
+            return
+        self.timer = threading.Timer(delay, self.__background_refresh)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def __background_refresh(self):
+        try:
+            with self.lock:
+                self.__refresh()
+        except Exception as e:
+            # the token is requested again by the next get_token once it is due
+            LOGGER.warning(f"Background Collab token refresh failed: {e}")
+
+    def __cancel_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+g_token_manager = None
+g_token_manager_lock = threading.Lock()
+
+
+def get_token_manager(domain, key, secret, cert):
+    """Returns the process wide CollabTokenManager (created on first call)
+    """
+    global g_token_manager
+    with g_token_manager_lock:
+        if g_token_manager is None:
+            g_token_manager = CollabTokenManager(domain, key, secret, cert)
+            # token renewed by the Collab request path when a call is refused with it (401)
+            Throttle.set_token_manager(g_token_manager)
+        return g_token_manager
@@ -3,6 +3,7 @@ from urllib import response
 import requests
 from src.views import Logger
 from src.models import Utilities as Utils
+from src.models import CollabThrottle as Throttle
 import json 
 from config import globalConfig
 
@@ -17,23 +18,31 @@ class CollabSessions:
         self.cert = cert
 
     ##### DATA SOURCE - API OPTION
-    def get_recordings(self, course_id, start_time):
+    def get_recordings(self, course_id, start_time, end_time=None, offset=0, limit=None, fields=None):
+        """Returns page of course recordings created from start_time (to end_time, otherwise to the present)
+        Args:
+            offset, limit (int): paging of the results
+            fields (str): comma separated recording attributes returned (all if None)
+        Returns:
+            json dict, or None if the request failed
+        """
         if globalConfig.LogDetail == "Verbose":
-            LOGGER.debug(f"for course ID {course_id} from {start_time}")
+            LOGGER.debug(f"for course ID {course_id} from {start_time} to {end_time} (offset {offset})")
         else:
             LOGGER.debug("")
-        endpoint = (
-            "https://"
-            + self.url
-            + "/recordings"
-            + "?contextId="
-            + course_id
-            + "&startTime="
-            + str(start_time) # This spans from the start time to the present
-        )
+        endpoint = "https://" + self.url + "/recordings"
+        params = {"contextId": course_id, "startTime": str(start_time)}
+        if end_time is not None:
+            params["endTime"] = str(end_time)
+        if offset:
+            params["offset"] = offset
+        if limit is not None:
+            params["limit"] = limit
+        if fields:
+            params["fields"] = fields
         bearer = "Bearer " + self.token
         rheaders = Utils.get_headers(bearer)
-        r = requests.get(endpoint, headers=rheaders, verify=self.cert)
+        r = Throttle.get(endpoint, params=params, headers=rheaders, verify=self.cert)
         return Utils.handle_response(r)
 
     ##### DATA SOURCE - DB OPTION
@@ -44,7 +53,7 @@ class CollabSessions:
             LOGGER.debug("")
         auth_str = "Bearer " + self.token
         url = "https://" + self.url + "/recordings/" + recording_id 
-        response = requests.get(url,
+        response = Throttle.get(url,
             headers={'Authorization': auth_str, 'Content-Type': 'application/json',
                 'Accept': 'application/json'}, verify=self.cert)
         data = json.loads(response.text)
@@ -63,23 +72,26 @@ class CollabSessions:
         auth_str = "Bearer " + self.token
         url = "https://" + self.url + "/recordings/" + recording_id + "/data"
         headers = Utils.get_headers(auth_str)
-        r = requests.get(url, headers, verify=self.cert)
+        r = Throttle.get(url, headers=headers, verify=self.cert)
         rec_data = Utils.handle_response(r)
         return rec_data
 
 
-    def get_private_recording_url(self,recording_id):
+    def get_private_recording_url(self,recording_id, valid_hours=1):
         LOGGER.debug("")
         auth_str = "Bearer " + self.token
-        url = "https://" + self.url + "/recordings/" + recording_id + "/url?validHours=1&disposition=download"
-        r = requests.get(url,
+        url = "https://" + self.url + "/recordings/" + recording_id + f"/url?validHours={valid_hours}&disposition=download"
+        r = Throttle.get(url,
                          headers={'Authorization': auth_str, 'Content-Type': 'application/json',
                                   'Accept': 'application/json'}, verify=self.cert)
-        json_data = json.loads(r.text)
+        json_data = Utils.handle_response(r)
         if globalConfig.LogDetail == "Verbose":
             LOGGER.debug(json_data)
         else:
             LOGGER.debug("")
+        if json_data is None or 'url' not in json_data:
+            LOGGER.error(f"No private url issued for {recording_id} ({r.status_code})")
+            return None
         return json_data['url']
 
 
@@ -91,7 +103,7 @@ class CollabSessions:
         url = f"https://{self.url}/recordings/{recording_id}"
         try:
             headers = Utils.get_headers(auth_str)
-            r = requests.delete(url,headers={'Authorization': auth_str, 'Content-Type': 'application/json',
+            r = Throttle.delete(url,headers={'Authorization': auth_str, 'Content-Type': 'application/json',
                                   'Accept': 'application/json'},verify=self.cert,)
             if r.status_code == 200:
                 return True
@@ -0,0 +1,189 @@
+import time
+import random
+import asyncio
+import aiohttp
+import threading
+import collections
+import email.utils
+import requests
+from src.models import HttpSession as Http
+from src.models.Limiter import RateLimiter
+from src.views import Logger
+from config import globalConfig
+
+LOGGER = Logger.init_logger(__name__)
+
+# shared by all Collab API calls (sync and async), at most CollabRateLimit calls per second
+LIMITER = RateLimiter(max_calls=max(1, globalConfig.CollabRateLimit), period=1)
+
+# {counter name: count} of Collab API calls: calls, throttled (429), server_errors (5xx), connection_errors, unauthorized (401), retries, gave_up
+g_counters = collections.Counter()
+g_counters_lock = threading.Lock()
+# time until which every call waits, after a 429 with Retry-After
+g_paused_until = [0.0]
+# process wide CollabJWT.CollabTokenManager, set once it is created
+g_token_manager = None
+
+
+def count(name: str):
+    with g_counters_lock:
+        g_counters[name] += 1
+
+
+def counters():
+    """Returns copy of the Collab API call counters, to tune concurrency against Collab's rate limits
+    """
+    with g_counters_lock:
+        return dict(g_counters)
+
+
+def retryable(status_code: int):
+    return status_code == 429 or status_code >= 500
+
+
+def backoff(attempt: int, retry_after: str = None):
+    """Returns seconds to wait before retry {attempt}: Retry-After (seconds or HTTP date) if given,
+        otherwise exponential backoff from globalConfig.CollabRetryBackoff with full jitter
+    """
+    if retry_after:
+        if retry_after.strip().isdigit():
+            return float(retry_after)
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(globalConfig.CollabRetryBackoffMax, globalConfig.CollabRetryBackoff * 2 ** attempt))
+
+
+def record_failure(status_code: int, attempt: int, retry_after: str, url: str):
+    """Counts a throttled / failed call and returns the seconds to wait before retrying it
+    """
+    count("throttled" if status_code == 429 else "server_errors" if status_code else "connection_errors")
+    wait = backoff(attempt, retry_after)
+    if status_code == 429 and retry_after:
+        # Collab asked us to slow down: every call waits, not just this one
+        g_paused_until[0] = max(g_paused_until[0], time.time() + wait)
+    count("retries")
+    LOGGER.warning(f"Collab {status_code or 'connection error'} - retry {attempt + 1} of {globalConfig.CollabRetries} in {wait:.1f}s -- {url}")
+    return wait
+
+
+def pause():
+    return max(0.0, g_paused_until[0] - time.time())
+
+
+def set_token_manager(token_manager):
+    global g_token_manager
+    g_token_manager = token_manager
+
+
+def refused_token(status_code: int, headers: dict):
+    """Returns the shared access token a call was refused with (401), None if the call was not unauthorized
+        or not made with the shared token
+    """
+    authorization = (headers or {}).get("Authorization", "")
+    if status_code != 401 or g_token_manager is None or not authorization.startswith("Bearer "):
+        return None
+    return authorization[len("Bearer "):]
+
+
+def renew_token(token: str, headers: dict, url: str):
+    """Invalidates the refused token and returns copy of the headers with a new one
+    """
+    count("unauthorized")
+    LOGGER.warning(f"Collab 401 - access token refused, retry with a new token -- {url}")
+    g_token_manager.invalidate(token)
+    return dict(headers, Authorization="Bearer " + g_token_manager.get_token())
+
+
+def request(method, url, **kwargs):
+    """Collab API request through the shared rate limiter.
+        429 and 5xx responses and connection errors are retried up to globalConfig.CollabRetries times,
+        after Retry-After or a jittered backoff.
+        A call refused with the shared access token (401) is retried once with a new token
+    Returns:
+        response (the last one if all retries were throttled)
+    """
+    attempt = 0
+    renewed = False
+    while True:
+        time.sleep(pause())
+        count("calls")
+        try:
+            with LIMITER:
+                r = Http.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt >= globalConfig.CollabRetries:
+                count("gave_up")
+                raise
+            time.sleep(record_failure(0, attempt, None, url))
+            attempt += 1
+            continue
+
+        token = None if renewed else refused_token(r.status_code, kwargs.get("headers"))
+        if token is not None:
+            kwargs["headers"] = renew_token(token, kwargs["headers"], url)
+            renewed = True
+            continue
+        if not retryable(r.status_code):
+            return r
+        if attempt >= globalConfig.CollabRetries:
+            count("gave_up")
+            LOGGER.error(f"Collab {r.status_code} after {attempt} retries -- {url}")
+            return r
+        time.sleep(record_failure(r.status_code, attempt, r.headers.get("Retry-After"), url))
+        attempt += 1
+
+
+def get(url, params=None, **kwargs):
+    return request("GET", url, params=params, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    return request("POST", url, data=data, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
+
+
+async def request_async(session, method, url, **kwargs):
+    """Async equivalent of request for an aiohttp session, sharing the rate limiter, counters and token renewal
+    Returns:
+        (status code, parsed json or None)
+    """
+    loop = asyncio.get_event_loop()
+    attempt = 0
+    renewed = False
+    while True:
+        await asyncio.sleep(pause())
+        count("calls")
+        # the limiter blocks while it waits for a slot: waited for in an executor thread, not on the event loop
+        await loop.run_in_executor(None, LIMITER.__enter__)
+        token = None
+        try:
+            async with session.request(method, url, **kwargs) as r:
+                status, retry_after = r.status, r.headers.get("Retry-After")
+                token = None if renewed else refused_token(status, kwargs.get("headers"))
+                if token is None and (not retryable(status) or attempt >= globalConfig.CollabRetries):
+                    try:
+                        data = await r.json(content_type=None)
+                    except ValueError:
+                        data = None
+                    if retryable(status):
+                        count("gave_up")
+                    return status, data
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+            if attempt >= globalConfig.CollabRetries:
+                count("gave_up")
+                raise
+            status, retry_after = 0, None
+        finally:
+            LIMITER.__exit__(None, None, None)
+        if token is not None:
+            # the token manager blocks while a new token is requested: in an executor thread
+            kwargs["headers"] = await loop.run_in_executor(None, renew_token, token, kwargs["headers"], url)
+            renewed = True
+            continue
+        await asyncio.sleep(record_failure(status, attempt, retry_after, url))
+        attempt += 1
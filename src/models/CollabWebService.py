@@ -1,14 +1,24 @@
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from tqdm import tqdm
 from config import Config as Conf
 from config import globalConfig
 from src.models import CollabJWT as Jwt
 from src.models import CollabSessions as Session
+from src.models import CollabThrottle as Throttle
+from src.models import CollabAsync as Async
+from src.models import RecordingCache as Cache
 from src.views import Logger
 
 LOGGER = Logger.init_logger(__name__)
 
+# {recording_id: (url, expiry time)} of the private recording urls issued by Collab
+g_private_urls = {}
+g_private_urls_lock = threading.Lock()
+
 
 class WebService:
     def __init__(self):
@@ -22,60 +32,118 @@ class WebService:
         #self.path = "/learn/api/public/v1/courses/contents/"
 
     def get_context(self):
+        """Returns Collab access token from the process wide token manager
+            (only requested from Collab when it is about to expire)
+        """
         try:
-            self.jsession = Jwt.CollabJWT(
+            self.jsession = Jwt.get_token_manager(
                 self.collab_domain, self.collab_key, self.collab_secret, self.cert
             )
-            token = self.jsession.refresh_JWT()
+            token = self.jsession.get_token()
             return token 
         except Exception as e:
             raise e
 
     ##### DATA SOURCE - API OPTION
     def courses_data_from_collab(self,course_filter):
+        """Crawls Collab contexts (courses), page by page.
+            Once the first page gives the total number of contexts, the remaining offsets
+            are fetched globalConfig.ContextCrawlConcurrency at a time.
+        Args:
+            course_filter (str): search term on course name ("" for all courses)
+        Returns:
+            generator of context dicts, yielded as their pages arrive (in offset order)
+        """
         LOGGER.info("Contacting Collab API")
-        json_pages = []
-        token = self.get_context()
         if globalConfig.LogDetail == "Verbose":
-            LOGGER.info(token)
+            LOGGER.info(self.get_context())
         else:
             LOGGER.debug("")
 
         def get_courses_from_collab(offset=0):
-            if course_filter == "":
-                url = f"https://{self.collab_domain}contexts?offset={offset}"
-            else:
-                url = f"https://{self.collab_domain}contexts?offset={offset}&name={course_filter}"
-
-            r = requests.get(url, headers={"Authorization": "Bearer " + token})           
+            params = {"offset": offset}
+            if course_filter != "":
+                params["name"] = course_filter
+            r = Throttle.get(
+                f"https://{self.collab_domain}/contexts", params=params,
+                headers={"Authorization": "Bearer " + self.get_context()}, verify=self.cert
+            )
+            r.raise_for_status()
             res = json.loads(r.text)
             if globalConfig.LogDetail == "Verbose":
                 LOGGER.info(res) 
             else:
-                LOGGER.debug("")
-            if bool(res["results"]) == True:
-                json_pages.append(res)
-                #breakpoint()
-                #offset += 1000
-                #get_courses_from_collab(offset)
-        if bool(json_pages) == False:
-            get_courses_from_collab()
-        return json_pages
+                LOGGER.debug(f"contexts offset {offset}: {len(res['results'])} results")
+            return res
+
+        first_page = get_courses_from_collab()
+        yield from first_page["results"]
+        page_size = len(first_page["results"])
+        if page_size == 0:
+            return
+
+        total = first_page.get("size")
+        if total is None:
+            # total unknown: follow the pages until one comes back short
+            offset = page_size
+            while True:
+                page = get_courses_from_collab(offset)
+                yield from page["results"]
+                if len(page["results"]) < page_size:
+                    return
+                offset += page_size
+
+        LOGGER.info(f"Crawling {total} Collab contexts")
+        offsets = range(page_size, total, page_size)
+        with ThreadPoolExecutor(max_workers=globalConfig.ContextCrawlConcurrency) as executor:
+            for page in executor.map(get_courses_from_collab, offsets):
+                yield from page["results"]
 
     ##### DATA SOURCE - API OPTION
-    def get_recordings_by_id(self, course_id, search_from):
+    def get_recordings_by_id(self, course_id, search_from, search_to=None):
         session = Session.CollabSessions(
             self.collab_domain, self.get_context(), self.cert
         )
-        recordings = session.get_recordings(course_id, search_from) # Response from collab api call
+        recordings = session.get_recordings(course_id, search_from, search_to) # Response from collab api call
         return recordings
 
+    ##### DATA SOURCE - API OPTION
+    def iter_recordings(self, course_id, search_from, search_to):
+        """Pages through the course recordings created between search_from and search_to,
+            globalConfig.RecordingsPageSize at a time, only returning globalConfig.RecordingFields
+        Returns:
+            generator of pages (lists of recording dicts), yielded as they arrive
+        Raises:
+            requests.exceptions.HTTPError: a page was not returned (the course is not processed partially)
+        """
+        offset = 0
+        while True:
+            session = Session.CollabSessions(
+                self.collab_domain, self.get_context(), self.cert
+            )
+            recs_json = session.get_recordings(
+                course_id, search_from, search_to, offset, globalConfig.RecordingsPageSize, globalConfig.RecordingFields
+            )
+            if recs_json is None:
+                msg = f"Recordings of course {course_id} not returned from offset {offset}"
+                LOGGER.error(msg)
+                raise requests.exceptions.HTTPError(msg)
+            results = recs_json.get("results", [])
+            if results:
+                yield results
+            offset += len(results)
+            if len(results) < globalConfig.RecordingsPageSize or offset >= recs_json.get("size", offset + 1):
+                return
+
     ##### DATA SOURCE - DB OPTION
     def get_recording_db(self, recording_id):
-        """Only used in preview mode (find recording)
+        """Find a single recording (from the recording cache if fetched within globalConfig.RecordingCacheTTL)
         Returns:
         rec json object as dict
         """
+        return self.cached_batch(Cache.RECORDING, self.__fetch_recording_db, None, [recording_id])[0]
+
+    def __fetch_recording_db(self, recording_id):
         rec = {}
         session = Session.CollabSessions(
             self.collab_domain, self.get_context(), self.cert
@@ -85,48 +153,167 @@ class WebService:
 
     ##### DATA SOURCE - DB OPTION
     def get_recordings_db(self, rec_id_list):
-        """Only used in actual mode (find recordings)
+        """Find recordings (see get_recordings_batch_db)
         Returns:
-        recs as list of dicts
+        recs as list of dicts, recordings not found on Collab left out
         """
-        recs = []
-        session = Session.CollabSessions(
-            self.collab_domain, self.get_context(), self.cert
-        )
-        for rec_id in rec_id_list:
-            rec = session.get_recording_object_db(rec_id)
-            recs.append(rec)
+        recs, not_found = self.get_recordings_batch_db(rec_id_list)
         return recs
 
+    ##### DATA SOURCE - DB OPTION
+    def get_recordings_batch_db(self, rec_id_list):
+        """Find recordings, up to globalConfig.RecordingFetchConcurrency at once
+        Args:
+            rec_id_list (list): recording ids listed in the DB
+        Returns:
+            recs (list of dicts): recordings found on Collab, in rec_id_list order
+            not_found (list): ids of recordings not found on Collab (db lag - deleted on collab)
+        """
+        if not rec_id_list:
+            return [], []
+
+        results = self.cached_batch(Cache.RECORDING, self.__fetch_recording_db, "get_recording_object_db", rec_id_list)
+
+        recs, not_found = [], []
+        for rec_id, rec in zip(rec_id_list, results):
+            if rec.get('errorKey') == 'resource_not_found':
+                not_found.append(rec_id)
+            else:
+                recs.append(rec)
+        return recs, not_found
+
+
+    def get_public_recordings_batch(self, recording_ids):
+        """get recording data of several recordings at once (see get_public_recording)
+        Returns:
+        list of json dicts (None for private recordings), in recording_ids order
+        """
+        return self.cached_batch(Cache.PUBLIC_DATA, self.__fetch_public_recording, "get_public_recording_data", recording_ids)
+
+    def delete_recordings_batch(self, recording_ids):
+        """Used to delete several recordings at once
+        Returns:
+        list of True, False, in recording_ids order
+        """
+        results = self.batch(self.__delete_recording, "delete_recording", recording_ids)
+        for recording_id, deleted in zip(recording_ids, results):
+            if deleted == True:
+                Cache.invalidate(recording_id)
+        return results
+
+    def cached_batch(self, kind, operation, async_operation, recording_ids):
+        """Returns responses of the recording cache, only fetching (see batch) the recordings 
+            not cached within globalConfig.RecordingCacheTTL. Only successful responses are cached
+            (recording objects with an id, public recording data): error bodies are never cached, 
+            recordings not found (or no longer public) are dropped from the cache
+        Args:
+            kind (str): RecordingCache.RECORDING or RecordingCache.PUBLIC_DATA
+        Returns:
+            list of results, in recording_ids order
+        """
+        results = Cache.get_many(kind, recording_ids)
+        missing = [recording_id for recording_id in recording_ids if recording_id not in results]
+        fetched = self.batch(operation, async_operation, missing)
+
+        for recording_id, result in zip(missing, fetched):
+            if kind == Cache.RECORDING and result.get('errorKey') == 'resource_not_found':
+                Cache.invalidate(recording_id)
+            elif kind == Cache.PUBLIC_DATA and result is None:
+                Cache.invalidate(recording_id, kind)
+            elif kind == Cache.RECORDING and "id" not in result:
+                # error body (401, 429, 5xx) or failed async call: fetched again next time
+                LOGGER.warning(f"Recording {recording_id} not returned by Collab: {result}")
+            else:
+                Cache.put(kind, recording_id, result)
+            results[recording_id] = result
+        return [results[recording_id] for recording_id in recording_ids]
+
+    def batch(self, operation, async_operation, recording_ids):
+        """Runs a recording operation for every recording id concurrently: on the async Collab client
+            (globalConfig.CollabAsyncClient) or with up to globalConfig.RecordingFetchConcurrency threads
+        Args:
+            operation (callable): WebService method taking a recording id
+            async_operation (str): name of the equivalent AsyncWebService method
+        Returns:
+            list of results, in recording_ids order
+        """
+        if not recording_ids:
+            return []
+        if len(recording_ids) == 1:
+            return [operation(recording_ids[0])]
+        if globalConfig.CollabAsyncClient == "Yes":
+            client = Async.get_async_webservice()
+            return Async.run(client.gather(getattr(client, async_operation), recording_ids))
+
+        workers = max(1, min(globalConfig.RecordingFetchConcurrency, len(recording_ids)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(operation, recording_ids))
 
     def get_public_recording(self, recording_id):
-        """get recording data for download report + action
+        """get recording data for download report + action 
+            (from the recording cache if fetched within globalConfig.RecordingCacheTTL)
+        Returns:
+        json dict
+        """
+        return self.cached_batch(Cache.PUBLIC_DATA, self.__fetch_public_recording, None, [recording_id])[0]
+
+    def refresh_public_recording(self, recording_id):
+        """get recording data from Collab again, e.g. once its stream url was refused (403)
         Returns:
         json dict
         """
+        Cache.invalidate(recording_id, Cache.PUBLIC_DATA)
+        return self.get_public_recording(recording_id)
+
+    def __fetch_public_recording(self, recording_id):
         session = Session.CollabSessions(
             self.collab_domain, self.get_context(), self.cert
         )
         rec_data = session.get_public_recording_data(recording_id)
         return rec_data
     
-    def get_private_recording(self, recording_id):
-        """get download url for private recording
+    def get_private_recording(self, recording_id, refresh=False):
+        """get download url for private recording.
+            Urls are cached until globalConfig.PrivateUrlRefreshMargin seconds before they expire,
+            then issued again (valid for globalConfig.PrivateUrlValidHours hours)
+        Args:
+            refresh (bool): issue a new url even if the cached one hasn't expired (e.g. after a 403)
         Returns:
         recording url string
         """
+        with g_private_urls_lock:
+            cached = g_private_urls.get(recording_id)
+        if not refresh and cached is not None and cached[1] - globalConfig.PrivateUrlRefreshMargin > time.time():
+            return cached[0]
+
+        issued = time.time()
         session = Session.CollabSessions(
             self.collab_domain, self.get_context(), self.cert
         )
-        rec_private_url = session.get_private_recording_url(recording_id)
+        rec_private_url = session.get_private_recording_url(recording_id, globalConfig.PrivateUrlValidHours)
+        if rec_private_url is not None:
+            LOGGER.debug(f"Private url issued for {recording_id}")
+            with g_private_urls_lock:
+                g_private_urls[recording_id] = (rec_private_url, issued + globalConfig.PrivateUrlValidHours * 3600)
         return rec_private_url
 
+    def private_recording_url_issuer(self, recording_id):
+        """Returns callable issuing the private recording url when a transfer starts:
+            issuer() returns the cached url, issuer(True) a new one after the url was refused
+        """
+        def issue_url(refresh=False):
+            return self.get_private_recording(recording_id, refresh)
+        return issue_url
+
 
     def delete_recording_from_collab(self, recording_id):
-        """Used to delete recording
+        """Used to delete recording (dropped from the recording cache once deleted)
         Returns:
         True, False
         """
+        return self.delete_recordings_batch([recording_id])[0]
+
+    def __delete_recording(self, recording_id):
         session = Session.CollabSessions(
             self.collab_domain, self.get_context(), self.cert
         )
@@ -1,8 +1,13 @@
 from config import Config as Conf
 from config import globalConfig
 from src.views import Logger
+from src.models import Utilities as Utils
+from src.models import RecordingsSnapshot as Snapshot
 from mysqlx import RowResult
 import pyodbc 
+import threading
+import queue
+import time
 
 LOGGER = Logger.init_logger(__name__)
 
@@ -19,19 +24,124 @@ class DatabaseFeed:
         self.con = Conf.db_connection["TrustServerCertificate"]
         self.encrypt = Conf.db_connection["Encrypt"]
         self.trusted_connection = Conf.db_connection["Trusted_Connection"]
+        # {(start_date, end_date, course_label): {course_label: {course_name: [recording ids]}}}
+        self.recordings_index = {}
+        self.index_lock = threading.Lock()
+        # idle connections as (connection, time returned to the pool), shared across the run
+        self.pool = queue.LifoQueue(maxsize=globalConfig.DbPoolSize)
+        # course labels and recording ids excluded from the eligible recordings (see set_exclusions)
+        self.blacklisted_courses = set()
+        self.migrated_recordings = set()
+        # {course_label: blacklisted} of the labels returned so far
+        self.blacklisted_labels = {}
+        Utils.register_shutdown_hook(self.close_connections)
 
 
     def db_connect(self):
+        """Opens a new DB connection
+        """
         try:
             if globalConfig.LogDetail == "Verbose":
                 LOGGER.debug("connecting to db")
             cnxn = pyodbc.connect(f'DRIVER={self.db_driver};SERVER={self.db_server};DATABASE={self.database};UID={self.username};PWD={self.password};TrustServerCertificate={self.con};Encrypt={self.encrypt};TRUSTED_CONNECTION = {self.trusted_connection}')
-            cursor = cnxn.cursor()
-            return cursor
+            return cnxn
         except Exception as e:
             LOGGER.error(str(e))
             raise e
-            
+
+    def acquire_connection(self):
+        """Returns a pooled connection, checked with a trivial query if it has been idle for more than
+            globalConfig.DbHealthCheckAfter seconds, or a new connection if none is idle (or healthy)
+        """
+        while True:
+            try:
+                cnxn, returned = self.pool.get_nowait()
+            except queue.Empty:
+                return self.db_connect()
+            if time.monotonic() - returned < globalConfig.DbHealthCheckAfter:
+                return cnxn
+            try:
+                cnxn.cursor().execute("SELECT 1").fetchall()
+                return cnxn
+            except pyodbc.Error as e:
+                LOGGER.warning(f"Dropping stale DB connection: {e}")
+                self.close_connection(cnxn)
+
+    def release_connection(self, cnxn):
+        """Returns connection to the pool (closed if the pool is full)
+        """
+        try:
+            self.pool.put_nowait((cnxn, time.monotonic()))
+        except queue.Full:
+            self.close_connection(cnxn)
+
+    def close_connection(self, cnxn):
+        try:
+            cnxn.close()
+        except pyodbc.Error as e:
+            LOGGER.debug(str(e))
+
+    def close_connections(self):
+        """Closes idle pooled connections (shutdown hook: at exit and before a restart)
+        """
+        while True:
+            try:
+                cnxn, returned = self.pool.get_nowait()
+            except queue.Empty:
+                return
+            self.close_connection(cnxn)
+
+    def execute_stream(self, sql_string, *params):
+        """Runs query on a pooled connection and streams its rows, globalConfig.DbFetchSize at a time.
+            A connection failing with an operational/interface error before the first row 
+            is dropped and the query tried once more on a new connection
+        Returns:
+            generator of rows
+        """
+        for attempt in range(2):
+            cnxn = self.acquire_connection()
+            streamed = False
+            try:
+                cursor = cnxn.cursor()
+                cursor.execute(sql_string, *params)
+                while True:
+                    rows = cursor.fetchmany(globalConfig.DbFetchSize)
+                    if not rows:
+                        break
+                    streamed = True
+                    yield from rows
+                cursor.close()
+            except (pyodbc.OperationalError, pyodbc.InterfaceError) as e:
+                self.close_connection(cnxn)
+                if attempt > 0 or streamed:
+                    raise e
+                LOGGER.warning(f"DB connection failed, reconnecting: {e}")
+                continue
+            except BaseException:
+                # includes a generator closed early: connection left with pending results
+                self.close_connection(cnxn)
+                raise
+            self.release_connection(cnxn)
+            return
+
+    def set_exclusions(self, blacklisted_courses, migrated_recordings):
+        """Course labels (blacklist) and recording ids (already migrated to Panopto) left out 
+            of the eligible recordings as they stream from the DB, so they never reach the download stage.
+            As in Blacklist.clean_downloads, a course is blacklisted if a blacklist entry is part of its label
+        Args:
+            blacklisted_courses (iterable): course labels
+            migrated_recordings (iterable): recording ids
+        """
+        with self.index_lock:
+            self.blacklisted_courses = set(label for label in blacklisted_courses if label)
+            self.migrated_recordings = set(migrated_recordings)
+            self.blacklisted_labels = {}
+            self.recordings_index = {}
+        Snapshot.check_blacklist(self.blacklisted_courses)
+        LOGGER.info(
+            f"DB feed excluding {len(self.blacklisted_courses)} blacklisted courses, "
+            f"{len(self.migrated_recordings)} migrated recordings"
+        )
 
     def get_eligible_recordings_db(self, start_date, end_date, course_label):
         """DB call to get recordings in rows including course_label, recording_id, creation_date and course_name
@@ -39,33 +149,93 @@ class DatabaseFeed:
             row[1] = recording_id
             row[2] = creation_date (used for troubleshooting only)
             row[3] = course_name
+            Blacklisted courses and migrated recordings (see set_exclusions) are dropped as the rows are fetched:
+            filtering them in SQL would need the procedure result in a temp table (INSERT ... EXEC),
+            run to the end before the first row is returned
         Returns:
-            list of tuples [(row[0],row[1],row[2],row[3])]
+            generator of rows (row[0],row[1],row[2],row[3]), fetched in batches as they are consumed
         """
-        cursor = self.db_connect()
         # print("-- execute stored proc eligible recordings --")
         if course_label == '':
-            sql_string = "execute [dbo].[get_eligible_recordings] @startDate = '" + start_date + "', @endDate = '" + end_date + "'"
+            sql_string = "execute [dbo].[get_eligible_recordings] @startDate = ?, @endDate = ?"
+            params = (start_date, end_date)
         else:
-            sql_string = "execute [dbo].[get_eligible_recordings] @courseLabel = '" + course_label + "', @startDate = '" + start_date + "', @endDate = '" + end_date + "'"
+            sql_string = "execute [dbo].[get_eligible_recordings] @courseLabel = ?, @startDate = ?, @endDate = ?"
+            params = (course_label, start_date, end_date)
         # print("sql_string: ",sql_string)
-        cursor.execute(sql_string)
-        rows = cursor.fetchall()
-        return rows
+        rows = self.execute_stream(sql_string, *params)
+        if not self.blacklisted_courses and not self.migrated_recordings:
+            return rows
+        return (row for row in rows if not self.excluded(row))
+
+    def is_blacklisted(self, course_label):
+        """True if a blacklist entry is part of the course label (result kept per label)
+        """
+        blacklisted = self.blacklisted_labels.get(course_label)
+        if blacklisted is None:
+            blacklisted = any(entry in course_label for entry in self.blacklisted_courses)
+            self.blacklisted_labels[course_label] = blacklisted
+        return blacklisted
+
+    def excluded(self, row):
+        return row[1] in self.migrated_recordings or self.is_blacklisted(row[0])
+
+    def get_eligible_recordings_rows(self, start_date, end_date, course_label):
+        """Eligible recordings rows of the window: from the local snapshot if it covers the window
+            (globalConfig.DbSnapshot), otherwise from the DB, written to the snapshot as they stream.
+            Snapshot rows taken before the current exclusions are filtered here
+        Returns:
+            iterable of rows (see get_eligible_recordings_db)
+        """
+        rows = Snapshot.read(start_date, end_date, course_label)
+        if rows is not None:
+            return (row for row in rows if not self.excluded(row))
+        return Snapshot.record(
+            start_date, end_date, course_label, self.get_eligible_recordings_db(start_date, end_date, course_label)
+        )
+
+    def get_eligible_recordings_index(self, start_date, end_date, course_label):
+        """Eligible recordings grouped as {course_label: {course_name: [recording ids]}}.
+            The stored procedure runs once per window: later calls for the same window, or for a course label
+            already returned by the window, are served from the index (and later runs from the snapshot).
+            Rows are grouped as they stream, but the index of the whole window is built before it is returned:
+            it holds the recording ids of the window (not the rows), the course list needs all of them
+        Returns:
+            dict
+        """
+        with self.index_lock:
+            index = self.recordings_index.get((start_date, end_date, course_label))
+            if index is not None:
+                return index
+            if course_label != '':
+                for (start, end, label_filter), window_index in self.recordings_index.items():
+                    if (start, end) == (start_date, end_date) and course_label in window_index:
+                        return {course_label: window_index[course_label]}
+
+            index = {}
+            # row[0] is course_label
+            # row[1] is recording_id
+            # row[3] is course_name
+            for row in self.get_eligible_recordings_rows(start_date, end_date, course_label):
+                index.setdefault(row[0], {}).setdefault(row[3], []).append(row[1])
+            self.recordings_index[(start_date, end_date, course_label)] = index
+            return index
+
+    def clear_recordings_index(self):
+        """Next call runs the stored procedure again (e.g. DB snapshot refreshed during the run)
+        """
+        with self.index_lock:
+            self.recordings_index = {}
 
     def get_distinct_label_names_db(self,start_date, end_date, course_label):
         """Extracting from db rows (tuple of tuples)
         Returns:
             tuple of tuples ((course_label, course_name)) 
         """
-        distinct_label_names = []
-        rows = self.get_eligible_recordings_db(start_date, end_date, course_label)
-        # row[0] is course_label
-        # row[3] is course_name
-        for row in rows:
-            if (row[0],row[3]) not in distinct_label_names:
-                distinct_label_names.append((row[0],row[3]))
-        return tuple(distinct_label_names)
+        index = self.get_eligible_recordings_index(start_date, end_date, course_label)
+        return tuple(
+            (label, name) for label, names in index.items() for name in names
+        )
 
 
     def get_recs_per_course_db(self, start_date, end_date, course_label):
@@ -73,20 +243,7 @@ class DatabaseFeed:
         Returns:
             tuple of tuples ((course_label,course_name,[rec_id list]))
         """
-        course_recs = {}
-        rows = self.get_eligible_recordings_db(start_date, end_date, course_label)
-        # row[0] is course_label
-        # row[1] is recording_id
-        # row[3] is course_name
-        for row in rows:
-            if (row[0],row[3]) in course_recs:
-                course_recs[row[0],row[3]].append((row[1]))
-            else:
-                course_recs[row[0],row[3]] = [(row[1])]
-        recs_per_course = []
-        # dict key: label_name = tuple
-        # dict value: rec_id_list = list
-        for label_name, rec_id_list in course_recs.items():
-            recs_per_course.append((label_name[0],label_name[1],rec_id_list))
-
-        return tuple(recs_per_course)
\ No newline at end of file
+        index = self.get_eligible_recordings_index(start_date, end_date, course_label)
+        return tuple(
+            (label, name, list(rec_id_list)) for label, names in index.items() for name, rec_id_list in names.items()
+        )
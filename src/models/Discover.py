@@ -1,10 +1,10 @@
 from ast import While
-import requests
 import urllib.parse
 import time
 import os
 from src.models import Utilities as Utils
 from src.models import Emails
+from src.models import Blacklist
 import traceback
 from src.views import Logger
 from config import globalConfig
@@ -18,89 +18,15 @@ LOGGER = Logger.init_logger(__name__)
 WEBSERVICE = Ws.WebService()
 
 class Discover:
-    def __init__(self, server, ssl_verify, oauth2, username, password):
+    def __init__(self, client):
         """
-        Constructor of sessions API handler instance.
-        This goes through authorization step of the target server.
+        Constructor of discover handler instance.
+        Calls go through the shared Panopto client (session, access token and retries).
         """
-        self.server = server
-        self.ssl_verify = ssl_verify
-        self.oauth2 = oauth2
-
-        # Use requests module's Session object in this example.
-        # ref. https://2.python-requests.org/en/master/user/advanced/#session-objects
-        self.requests_session = requests.Session()
-        self.requests_session.verify = self.ssl_verify
-        # self.__setup_or_refresh_access_token()
-
-        # NEW - JBRUYLANT 230621
-        self.username = username
-        self.password = password
-        self.__setup_or_refresh_access_token()
-
-        self.sessions = PanoptoSessions(
-            self.server,
-            self.ssl_verify,
-            self.oauth2,
-            self.username,
-            self.password,
-        )
-
-    def __setup_or_refresh_access_token(self,):
-        """
-        This method invokes OAuth2 Authorization Code Resource Owner Grant authorization flow.
-        It refreshes the access token with no browser required.
-        This is called at the initialization of the class, as well as when 401 (Unaurhotized) is returend.
-        """
-        # Changed OAuth2 method from get_access_token_authorization_code_grant to get_access_token_resource_owner_grant
-        # This is to resolve "unauthorized.Refresh access token"
-        access_token = self.oauth2.get_access_token_resource_owner_grant(self.username,self.password)
-        self.requests_session.headers.update(
-            {"Authorization": "Bearer " + access_token}
-        )
-        if globalConfig.LogDetail == "Verbose":
-            LOGGER.debug(access_token) 
-        else:
-            LOGGER.debug("")
-
-    def __check_retry_needed(self, response):
-        """
-        Inspect the response of a requets' call.
-        True indicates retry is needed, False indicates success. Otherwise an exception is thrown.
-        Reference: https://stackoverflow.com/a/24519419
-
-        This method detects
-            - 401 (Unauthorized), refresh the access token, and return as "is retry needed"
-            - 429 (Too many requests) which means API throttling by the server, wait 10 secs and return as "is retry needed"
-            - 500 (Internal server error), wait 50 secs and return as "is retry needed"
-
-        Production code should handle other failure cases and errors as appropriate.
-        """
-        if response.status_code // 100 == 2:
-            # Success on 2xx responses.
-            return False
-
-        if response.status_code == 401:
-            print("Unauthorized. Refresh access token.")
-            LOGGER.debug("Unauthorized. Refresh access token.")
-            self.__setup_or_refresh_access_token()
-            return True
-
-        if response.status_code == 429:
-            print("Too many requests. Wait 10 secs, and retry.")
-            LOGGER.debug("Too many requests. Wait 10 secs, and retry.")
-            time.sleep(10)
-            return True
-        
-        if response.status_code == 500:
-            print("Internal Server Error. Wait 50 secs and retry.")
-            LOGGER.debug("Internal Server Error. Wait 50 secs and retry.")
-            time.sleep(50)
-            return True
-
-        # Throw unhandled cases.
-        response.raise_for_status()
-
+        self.client = client
+        self.server = client.server
+        self.ssl_verify = client.ssl_verify
+        self.sessions = PanoptoSessions(client)
 
     def mitigate(self,undiscovered_uploads_list = [], failed_ppto_deletions_list = []):
         """Mitigation process to re-discover + re-delete 
@@ -152,9 +78,7 @@ class Discover:
                 try:
                     filename = os.path.basename(ele)                    
                     url = f"https://{self.server}/Panopto/api/v1/folders/{folderId}/sessions"
-                    resp = self.requests_session.get(url=url)
-                    if self.__check_retry_needed(resp):
-                        continue                    
+                    resp = self.client.get(url=url)
                     data = resp.json()
                     entries = data['Results']
                     for rec in entries:
@@ -162,14 +86,12 @@ class Discover:
                         if rec['Name'] == filename:
                             # RENAME STEP
                             ppto_name = Utils.rename_recording(filename, courseLabel)
+                            if ppto_name == '':
+                                continue
                             url = f"https://{self.server}/Panopto/api/v1/sessions/{rec['Id']}" 
                             payload = {"Name": ppto_name}
                             headers = {"content-type": "application/json"}
-                            resp = self.requests_session.put(
-                                url=url, json=payload, headers=headers
-                            )
-                            if self.__check_retry_needed(resp):
-                                continue
+                            self.client.put(url=url, json=payload, headers=headers)
                             msg = f"Renamed: {filename}"
                             print(msg)
                             LOGGER.info(msg)
@@ -201,6 +123,9 @@ class Discover:
                             else:
                                 print("No BB delete")
                                 LOGGER.debug("No BB delete") 
+
+                            # excluded from the DB feed of later runs
+                            Blacklist.record_migrated_recordings([filename])
                                                        
                             # REFRESH UNDISCOVERED LIST
                             if ele in undiscovered_uploads_list_final:
@@ -1,36 +1,53 @@
 import requests
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 
 import os
 from src.models import CollabWebService as Ws
 from src.models import Utilities as Utils
+from src.models import HttpSession as Http
+from src.models import Spool
 from src.views import Reports
 from src.views import Logger
 import os.path
+import time
+import json
+import threading
+import hashlib
+import base64
 from config import globalConfig
 
 WEBSERVICE = Ws.WebService()
 LOGGER = Logger.init_logger(__name__)
-PATH = "./downloads/"
+PART_SUFFIX = ".part"
+CHECKPOINT_SUFFIX = ".json"
 
 g_expected_uploads = []
+# {recording filename: {"size": content-length, "checksum": hex digest or None}} of verified downloads
+g_verified_downloads = {}
 
 ##### DATA SOURCE - API OPTION
 def get_recordings_list_by_id(id: str, start_date: str, end_date: str):
     """Obtains json of data associated with each recording.
+        Recordings are requested for the date window, page by page, and each page
+        goes through the eligibility filter as it arrives
     Args:
         id (str): Course ID
         start_date (str): date in "%Y-%m-%dT%H:%M:%SZ" format 
         end_date (str): date in "%Y-%m-%dT%H:%M:%SZ" format 
     Returns:
-        list[dict]: None, or list of dicts containing recording objects 
+        list[dict]: recordings found for download (as entered in the download reports), empty if none
+        list: ids of recordings with incomplete data
     """
     LOGGER.debug(f"course_id = {id}")
-    Utils.handle_types([(id, ""), (start_date, "")])
-    recs_json = WEBSERVICE.get_recordings_by_id(id, start_date)
-    if len(recs_json["results"]) != 0:
-        return list_of_recordings(recs_json, end_date)
-    return None
+    Utils.handle_types((id, ""), (start_date, ""))
+
+    eligible_recordings_list, failed_pre_downloads_list = [], []
+    for results in WEBSERVICE.iter_recordings(id, start_date, end_date):
+        eligible_recordings, failed_pre_downloads = list_of_recordings({"results": results}, end_date)
+        eligible_recordings_list += eligible_recordings
+        failed_pre_downloads_list += failed_pre_downloads
+    return eligible_recordings_list, failed_pre_downloads_list
 
 ##### DATA SOURCE - API OPTION
 def list_of_recordings(recs_json: dict, end_date):
@@ -52,20 +69,21 @@ def list_of_recordings(recs_json: dict, end_date):
     eligible_recordings_list = []
     failed_pre_downloads_list = []
     
-    results = recs_json["results"] 
-    for i in range(len(results)):
-        if results[i]["created"] <= end_date:
-            rec_data = WEBSERVICE.get_public_recording(results[i]["id"])
-            if rec_data != None:
-                # Data attribute returned means public recording
-                result, failed_pre_download = Utils.create_list_entry(results[i], recording_type = 1)
-            else:
-                # No data attribute returned means private recording
-                result, failed_pre_download = Utils.create_list_entry(results[i], recording_type = 2)
-            if result != {}:
-                eligible_recordings_list.append(result)
-            if failed_pre_download != "":
-                failed_pre_downloads_list.append(failed_pre_download)
+    # end of the window is also applied by Collab: guards against recordings created at the boundary
+    results = [rec for rec in recs_json["results"] if rec["created"] <= end_date]
+    # public data probes resolved at once, None for private recordings
+    recs_data = WEBSERVICE.get_public_recordings_batch([rec["id"] for rec in results])
+    for rec, rec_data in zip(results, recs_data):
+        if rec_data != None:
+            # Data attribute returned means public recording
+            result, failed_pre_download = Utils.create_list_entry(rec, recording_type = 1, rec_data = rec_data)
+        else:
+            # No data attribute returned means private recording
+            result, failed_pre_download = Utils.create_list_entry(rec, recording_type = 2)
+        if result != {}:
+            eligible_recordings_list.append(result)
+        if failed_pre_download != "":
+            failed_pre_downloads_list.append(failed_pre_download)
 
     return eligible_recordings_list, failed_pre_downloads_list
 
@@ -87,28 +105,29 @@ def list_of_recordings_db(rec_objects: list):
     eligible_recordings_list = []
     failed_pre_downloads_list = []
  
-    for i in range(len(rec_objects)):
-        # db snapshot one-day lag - case when deleted on collab
-        if rec_objects[i].get('errorKey') == 'resource_not_found':
-            continue
-        else: 
-            rec_data = WEBSERVICE.get_public_recording(rec_objects[i]["id"])
-            # Data attribute only present for public recording not for private recording
-            if rec_data != None:
-                result, failed_pre_download = Utils.create_list_entry(rec_objects[i], recording_type = 1)
-            else:
-                result, failed_pre_download = Utils.create_list_entry(rec_objects[i], recording_type = 2)
-            # either result or failed_pre_download has a value
-            if result != {}:
-                eligible_recordings_list.append(result)
-            if failed_pre_download != "":
-                failed_pre_downloads_list.append(failed_pre_download)
+    # db snapshot one-day lag - case when deleted on collab
+    rec_objects = [rec for rec in rec_objects if rec.get('errorKey') != 'resource_not_found']
+    # public data probes resolved at once, None for private recordings
+    recs_data = WEBSERVICE.get_public_recordings_batch([rec["id"] for rec in rec_objects])
+
+    for rec, rec_data in zip(rec_objects, recs_data):
+        # Data attribute only present for public recording not for private recording
+        if rec_data != None:
+            result, failed_pre_download = Utils.create_list_entry(rec, recording_type = 1, rec_data = rec_data)
+        else:
+            result, failed_pre_download = Utils.create_list_entry(rec, recording_type = 2)
+        # either result or failed_pre_download has a value
+        if result != {}:
+            eligible_recordings_list.append(result)
+        if failed_pre_download != "":
+            failed_pre_downloads_list.append(failed_pre_download)
     return eligible_recordings_list, failed_pre_downloads_list
 
 
 def get_recordings_for_course(rec_objects: list, course_label: str):
     """Calls functions to:
         - download relevant public and private recordings per course (creates mp4 recording file). 
+          Up to globalConfig.DownloadConcurrency recordings are downloaded at once.
         - add entry to public or private download report for each recording
     Args:
         rec_objects (list of dicts): List of eligible recordings
@@ -125,12 +144,21 @@ def get_recordings_for_course(rec_objects: list, course_label: str):
 
     failed_downloads, failed_download_ids = [],[]
 
-    for rec in rec_objects:
+    def download_recording(rec):
         if "403_msg" in rec: # private recording data is forbidden
-            failed_download, failed_download_id = download_private_recording_from_collab(rec, course_label)
+            return download_private_recording_from_collab(rec, course_label)
+        else:
+            return download_public_recording_from_collab(rec, course_label)
+
+    # bounded pool of download workers - results come back in rec_objects order
+    workers = max(1, min(globalConfig.DownloadConcurrency, len(rec_objects)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(download_recording, rec_objects))
+
+    for rec, (failed_download, failed_download_id) in zip(rec_objects, results):
+        if "403_msg" in rec:
             Reports.append_report_private_entry(course_label, rec)
         else:
-            failed_download, failed_download_id = download_public_recording_from_collab(rec, course_label)
             Reports.append_report_public_entry(course_label, rec)
         
         if failed_download != '':
@@ -149,6 +177,7 @@ def download_public_recording_from_collab(recording: dict, course_label: str):
         course_label (str)
     Result:
         Newly created file containing recording (.mp4) 
+        or, in Stream transfer mode, recording url registered as stream source
     Returns:
     failed_download, failed_download_id
     """
@@ -158,17 +187,28 @@ def download_public_recording_from_collab(recording: dict, course_label: str):
 
     failed_download, failed_download_id = '',''
 
-    rec_public_data = WEBSERVICE.get_public_recording(recording["recording_id"])
-    if rec_public_data != None:
+    # stream url carried from the public recording probe, otherwise requested again
+    stream_url = recording.get("stream_url")
+    if stream_url is None:
+        rec_public_data = WEBSERVICE.get_public_recording(recording["recording_id"])
+        if rec_public_data != None:
+            stream_url = rec_public_data["extStreams"][0]["streamUrl"]
+
+    def issue_url(refresh=False):
+        # stream url from cached recording data may have expired: refused url is requested again
+        nonlocal stream_url
+        if refresh:
+            rec_public_data = WEBSERVICE.refresh_public_recording(recording["recording_id"])
+            stream_url = rec_public_data["extStreams"][0]["streamUrl"] if rec_public_data != None else None
+        return stream_url
+
+    if stream_url != None:
         filename = Utils.return_download_filename(course_label, recording, ".mp4")
-        if filename != '':
-            print(f"Downloading: {filename}")
-            failed_download = download_stream(rec_public_data["extStreams"][0]["streamUrl"], f"{PATH}{filename}")
-            if check_local_downloaded_file(filename) == True:
-                g_expected_uploads.append(filename)
-            else:
-                failed_download = filename
-                failed_download_id = recording["recording_id"]
+        if filename != '' and globalConfig.TransferMode == "Stream":
+            Utils.register_stream_source(filename, issue_url)
+            g_expected_uploads.append(filename)
+        elif filename != '':
+            failed_download, failed_download_id = download_to_spool(stream_url, filename, recording, issue_url)
         else:
             failed_download = failed_download_id = recording["recording_id"]
     
@@ -176,12 +216,14 @@ def download_public_recording_from_collab(recording: dict, course_label: str):
 
 
 def download_private_recording_from_collab(recording: dict, course_label: str,):
-    """Downloads private recording for given course label, writes it to file
+    """Downloads private recording for given course label, writes it to file.
+        The private url is only issued when the transfer starts (and again if it is refused or expires)
     Args:
         recording (dict): dict from parsed recording json
         course_label (str)
     Result:
         Newly created file containing recording (.mp4) 
+        or, in Stream transfer mode, recording url issuer registered as stream source
     Returns:
     failed_download, failed_download_id    
     """
@@ -189,77 +231,419 @@ def download_private_recording_from_collab(recording: dict, course_label: str,):
 
     failed_download, failed_download_id = '', ''
 
-    rec_private_url = WEBSERVICE.get_private_recording(recording["recording_id"])
-    if rec_private_url != None:
-        filename = Utils.return_download_filename(course_label, recording, ".mp4")
-        if filename != '':
-            print(f"Downloading: {filename}")
-            failed_download = download_stream(rec_private_url, f"{PATH}{filename}")
-            if check_local_downloaded_file(filename) == True:
-                g_expected_uploads.append(filename)
-            else:
-                failed_download = filename
-                failed_download_id = recording["recording_id"]
-        else:
-            failed_download = failed_download_id = recording["recording_id"]
+    issue_url = WEBSERVICE.private_recording_url_issuer(recording["recording_id"])
+    filename = Utils.return_download_filename(course_label, recording, ".mp4")
+    if filename != '' and globalConfig.TransferMode == "Stream":
+        Utils.register_stream_source(filename, issue_url)
+        g_expected_uploads.append(filename)
+    elif filename != '':
+        failed_download, failed_download_id = download_to_spool(None, filename, recording, issue_url)
+    else:
+        failed_download = failed_download_id = recording["recording_id"]
     
     return failed_download, failed_download_id
 
 
-def download_stream(url: str, fname: str):
+def download_to_spool(url: str, filename: str, recording: dict, refresh_url=None):
+    """Downloads recording to the spool folder, once spool space is reserved for its Collab storage size.
+        The reservation is released if the download fails.
+    Args:
+        url (str): recording url, or None to have it issued by refresh_url once the download is admitted
+        filename (str): download filename
+        recording (dict): dict from parsed recording json
+        refresh_url (callable): issues the recording url (see download_stream)
+    Returns:
+    failed_download, failed_download_id
+    """
+    if not Spool.reserve(filename, recording.get("storage_size", 0)):
+        return filename, recording["recording_id"]
+
+    print(f"Downloading: {filename}")
+    download_stream(url, f"{Spool.path()}{filename}", refresh_url)
+    if check_local_downloaded_file(filename) == True:
+        Spool.commit(filename)
+        g_expected_uploads.append(filename)
+        return '', ''
+
+    # a rejected file must not be picked up from the spool folder by the upload
+    Utils.remove_download(f"{Spool.path()}{filename}")
+    return filename, recording["recording_id"]
+
+
+def download_stream(url: str, fname: str, refresh_url=None):
     """Download recording stream from url and write to file
+        Data is written to {fname}.part first and only renamed to fname once the 
+        number of bytes received matches the content-length of the recording.
+        An interrupted transfer is resumed with a Range request from the last byte written
+        (up to globalConfig.DownloadRetries times), including a .part file left by a previous run.
+        The stream is read in chunks of globalConfig.DownloadChunkSize bytes into a file preallocated 
+        from the content-length; progress is reported every globalConfig.DownloadProgressInterval seconds.
+        Recordings of globalConfig.SegmentedDownloadThreshold bytes or more are fetched as
+        globalConfig.DownloadSegments byte ranges in parallel when the server accepts ranges.
+        Single-stream downloads are hashed (globalConfig.DownloadChecksum) as they are written and 
+        restarted if an md5 digest doesn't match the server Content-MD5 (or the ETag, if
+        globalConfig.DownloadChecksumEtag is Yes); segmented downloads are verified on their byte count only.
+        The size and checksum of the finished download are kept in g_verified_downloads.
+        With refresh_url (private recordings), the url is taken from refresh_url() before every attempt
+        and issued again with refresh_url(True) when a request or resumed range request is refused (403).
     Args:
-        url (str): recording url
+        url (str): recording url (None if issued by refresh_url)
         fname (str): file path to write recording to
+        refresh_url (callable): issues the recording url, refresh_url(True) forces a new one
     Result:
         Newly created file containing recording data (usually .mp4)
+    Returns:
+        failed_download: '' or fname
     """
     if globalConfig.LogDetail == "Verbose":
         LOGGER.debug(f"Download from => {url} -- Save to => {fname}") 
     else:
         LOGGER.debug("")
 
-    Utils.handle_types([(url, ""), (fname, "")])
+    Utils.handle_types((fname, ""))
 
     failed_download = ''
+    part_fname = f"{fname}{PART_SUFFIX}"
+    retries = 0
+    refused = False
+
+    while True:
+        try:
+            if refresh_url is not None:
+                url = refresh_url(refused)
+                refused = False
+            if url is None:
+                raise IOError("No recording url issued by Collab")
+
+            checkpoint = read_checkpoint(part_fname)
+            checksum = None
+            if checkpoint is not None and "segments" in checkpoint:
+                total = checkpoint["content_length"]
+                LOGGER.info(f"Resuming segmented download -- {os.path.basename(fname)}")
+                written = download_segments(url, part_fname, total, checkpoint["segments"])
+            else:
+                total, written, checksum = download_single_stream(url, part_fname)
+
+            if not total or written == total:
+                finalise_part_file(part_fname, fname, written)
+                g_verified_downloads[os.path.basename(fname)] = {"size": written, "checksum": checksum}
+                LOGGER.info(f"Download verified: {written} bytes, {globalConfig.DownloadChecksum} {checksum} -- {os.path.basename(fname)}")
+                break
+            raise IOError(f"Incomplete download: {written} of {total} bytes received")
+
+        except FileNotFoundError as fe:
+            failed_download = fname
+            print("Error downloading file. ")
+            print(str(fe))
+            LOGGER.debug("Error downloading file. ")
+            LOGGER.error(str(fe))
+            break
+        except Exception as e:
+            retries += 1
+            if retries > globalConfig.DownloadRetries:
+                failed_download = fname
+                LOGGER.error(str(e))
+                break
+            refused = url_refused(e)
+            if refused and refresh_url is not None:
+                # expired or revoked url: issued again, no need to wait
+                LOGGER.warning(f"Recording url refused, issuing a new one ({retries} of {globalConfig.DownloadRetries})")
+                continue
+            LOGGER.warning(f"Download interrupted, retry {retries} of {globalConfig.DownloadRetries} -- {e}")
+            time.sleep(globalConfig.DownloadRetrySleep)
 
-    try:
-        resp = requests_get_stream(url, True)
-    except:
-        failed_download = fname
-        LOGGER.error(str(e))
+    return failed_download
+
+
+def download_single_stream(url: str, part_fname: str):
+    """Downloads recording over a single connection, from the resume offset of the part file.
+        Hands over to download_segments for a fresh download of a large recording.
+    Returns:
+        total, written, checksum: content-length of the recording, bytes in the part file 
+        and hex digest of the complete file (None if not computed)
+    """
+    written = resume_offset(part_fname)
+    resp = requests_get_stream(url, True, written)
+
+    if resp.status_code == 416: # range not satisfiable - nothing left to fetch or part file is invalid
+        total = content_range_total(resp)
+        if total is not None and written == total:
+            return total, written, None
+        discard_part_file(part_fname)
+        raise IOError(f"Invalid partial download discarded ({written} bytes)")
+    resp.raise_for_status()
+
+    if resp.status_code == 206:
+        total = content_range_total(resp)
+        checkpoint = read_checkpoint(part_fname)
+        if checkpoint is not None and checkpoint["content_length"] not in (total, 0):
+            discard_part_file(part_fname)
+            raise IOError("Recording size changed since the partial download - restarting")
+        LOGGER.info(f"Resuming download from byte {written} -- {os.path.basename(part_fname)}")
+    else:
+        # full content returned: (re)start from byte zero
+        total = int(resp.headers.get("content-length", 0))
+        written = 0
+        if use_segments(resp, total):
+            resp.close()
+            # segments arrive out of order: only the byte count is verified
+            return total, download_segments(url, part_fname, total, split_segments(total)), None
+
+    digest = new_digest(part_fname, written)
+    written = write_stream(resp, part_fname, total, written, digest)
+    if digest is None or written != total:
+        return total, written, None
+
+    expected = server_md5(resp)
+    if expected is not None and digest.name == "md5" and digest.hexdigest() != expected:
+        discard_part_file(part_fname)
+        raise IOError(f"Checksum mismatch: md5 {digest.hexdigest()}, server {expected} - restarting")
+    return total, written, digest.hexdigest()
+
+
+def write_stream(resp, part_fname: str, total: int, written: int, digest=None):
+    """Writes response body to part file from byte {written} onwards, updating {digest} with every chunk.
+        Progress bar and resume checkpoint are only updated every DownloadProgressInterval seconds,
+        and the checkpoint is always saved on exit so an interrupted transfer resumes from the last byte written.
+    Returns:
+        int: number of bytes in the part file
+    """
+    with open(part_fname, "r+b" if os.path.isfile(part_fname) else "w+b") as file:
+        if total and globalConfig.DownloadPreallocate == "Yes":
+            save_checkpoint(part_fname, total, written)
+            preallocate(file, total)
+        file.seek(written)
+
+        interval = globalConfig.DownloadProgressInterval
+        progress_bar = tqdm(
+            total=total, initial=written, unit="iB", unit_scale=True, unit_divisor=1024, mininterval=interval
+        )
+        reported, last_report = written, time.monotonic()
+        try:
+            for data in resp.iter_content(chunk_size=globalConfig.DownloadChunkSize):
+                written += file.write(data)
+                if digest is not None:
+                    digest.update(data)
+                if time.monotonic() - last_report >= interval:
+                    file.flush()
+                    save_checkpoint(part_fname, total, written)
+                    progress_bar.update(written - reported)
+                    reported, last_report = written, time.monotonic()
+        finally:
+            file.flush()
+            save_checkpoint(part_fname, total, written)
+            progress_bar.update(written - reported)
+            progress_bar.close()
+
+    return written
+
+
+def new_digest(part_fname: str, written: int):
+    """Returns globalConfig.DownloadChecksum hash object, seeded with the first {written} bytes 
+        of the part file when a download is resumed (None if checksums are disabled)
+    """
+    if globalConfig.DownloadChecksum not in ("md5", "sha256"):
+        return None
+    digest = hashlib.new(globalConfig.DownloadChecksum)
+    if written:
+        with open(part_fname, "rb") as file:
+            while file.tell() < written:
+                data = file.read(min(globalConfig.DownloadChunkSize, written - file.tell()))
+                if not data:
+                    break
+                digest.update(data)
+    return digest
+
+
+def server_md5(resp):
+    """Returns the MD5 hex digest of the recording given by the server, from the Content-MD5 header
+        or, if globalConfig.DownloadChecksumEtag is Yes, a single part S3 style ETag 
+        (storage ETags are not always the content MD5, e.g. SSE-KMS or CDN ETags).
+        None if the server gives none: the download is then only verified on its size
+    """
+    content_md5 = resp.headers.get("content-md5")
+    if content_md5:
+        try:
+            return base64.b64decode(content_md5).hex()
+        except ValueError:
+            return None
+    if globalConfig.DownloadChecksumEtag != "Yes":
+        return None
+    etag = resp.headers.get("etag", "").strip('"')
+    if len(etag) == 32 and all(c in "0123456789abcdef" for c in etag.lower()):
+        return etag.lower()
+    return None
+
+
+def use_segments(resp, total: int):
+    """Segmented download applies to recordings above the size threshold, 
+        if the server advertises byte range support
+    """
+    return (
+        globalConfig.DownloadSegments > 1
+        and total >= globalConfig.SegmentedDownloadThreshold
+        and resp.headers.get("accept-ranges", "").lower() == "bytes"
+    )
+
+
+def split_segments(total: int):
+    """Splits recording in DownloadSegments byte ranges
+    Returns:
+        list of [first byte, last byte, bytes written] lists
+    """
+    size = -(-total // globalConfig.DownloadSegments)
+    return [[start, min(start + size, total) - 1, 0] for start in range(0, total, size)]
+
+
+def download_segments(url: str, part_fname: str, total: int, segments: list):
+    """Fetches byte ranges of the recording in parallel, each written in place in the preallocated part file.
+        The progress of every segment is saved in the part file checkpoint, so only missing bytes are fetched again.
+    Args:
+        segments (list): [first byte, last byte, bytes written] lists
+    Returns:
+        int: number of bytes written over all segments
+    """
+    with open(part_fname, "r+b" if os.path.isfile(part_fname) else "w+b") as file:
+        preallocate(file, total)
+    save_checkpoint(part_fname, total, sum(segment[2] for segment in segments), segments)
+
+    lock = threading.Lock()
+    interval = globalConfig.DownloadProgressInterval
+    progress_bar = tqdm(
+        total=total, initial=sum(segment[2] for segment in segments),
+        unit="iB", unit_scale=True, unit_divisor=1024, mininterval=interval
+    )
+
+    def report(segment, done):
+        # bytes are flushed to the file before they are recorded in the checkpoint
+        with lock:
+            progress_bar.update(done - segment[2])
+            segment[2] = done
+            save_checkpoint(part_fname, total, sum(segment[2] for segment in segments), segments)
+
+    def fetch_segment(segment):
+        first, last, done = segment
+        if first + done > last:
+            return
+        resp = requests_get_stream(url, True, first + done, last)
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            raise IOError(f"Range request refused ({resp.status_code})")
+        with open(part_fname, "r+b") as file:
+            file.seek(first + done)
+            last_report = time.monotonic()
+            try:
+                for data in resp.iter_content(chunk_size=globalConfig.DownloadChunkSize):
+                    done += file.write(data)
+                    if time.monotonic() - last_report >= interval:
+                        file.flush()
+                        report(segment, done)
+                        last_report = time.monotonic()
+            finally:
+                file.flush()
+                report(segment, done)
 
-    total = int(resp.headers.get("content-length", 0))
-    progress_bar = tqdm(total=total, unit="iB", unit_scale=True, unit_divisor=1024)
     try:
-        with open(fname, "wb") as file:
-            for data in resp.iter_content(chunk_size=1024):
-                size = file.write(data)
-                progress_bar.update(size)
+        with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+            list(executor.map(fetch_segment, segments))
+    finally:
         progress_bar.close()
-    except FileNotFoundError as fe:
-        failed_download = fname
-        print("Error downloading file. ")
-        print(str(fe))
-        LOGGER.debug("Error downloading file. ")
-        LOGGER.error(str(fe))
-    except Exception as e:
-        failed_download = fname
-        LOGGER.error(str(e))    
-    return failed_download
+
+    return sum(segment[2] for segment in segments)
+
+
+def url_refused(e: Exception):
+    """True if the recording url was refused (403), e.g. a private url that expired
+    """
+    response = getattr(e, "response", None)
+    return response is not None and response.status_code == 403
+
+
+def preallocate(file, size: int):
+    """Reserves {size} bytes on disk for the file (no-op if it is already that big)
+    """
+    if os.fstat(file.fileno()).st_size >= size:
+        return
+    try:
+        os.posix_fallocate(file.fileno(), 0, size)
+    except (AttributeError, OSError):
+        # posix_fallocate is not available on Windows or on some filesystems
+        file.truncate(size)
+
+
+def resume_offset(part_fname: str):
+    """Returns the number of bytes already downloaded to the part file: 
+        from its checkpoint (preallocated file), otherwise from its size
+    """
+    if not os.path.isfile(part_fname):
+        return 0
+    checkpoint = read_checkpoint(part_fname)
+    if checkpoint is not None:
+        return checkpoint["written"]
+    return os.path.getsize(part_fname)
+
+
+def read_checkpoint(part_fname: str):
+    try:
+        with open(f"{part_fname}{CHECKPOINT_SUFFIX}") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(part_fname: str, total: int, written: int, segments: list = None):
+    checkpoint = {"content_length": total, "written": written}
+    if segments is not None:
+        checkpoint["segments"] = segments
+    with open(f"{part_fname}{CHECKPOINT_SUFFIX}", "w") as f:
+        json.dump(checkpoint, f)
+
+
+def finalise_part_file(part_fname: str, fname: str, written: int):
+    """Trims part file to the bytes received and renames it into place
+    """
+    with open(part_fname, "r+b") as file:
+        file.truncate(written)
+    os.replace(part_fname, fname)
+    if os.path.isfile(f"{part_fname}{CHECKPOINT_SUFFIX}"):
+        os.remove(f"{part_fname}{CHECKPOINT_SUFFIX}")
 
 
-def requests_get_stream(url, stream=True):
-    return requests.get(url, stream=stream)
+def discard_part_file(part_fname: str):
+    for path in (part_fname, f"{part_fname}{CHECKPOINT_SUFFIX}"):
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def content_range_total(resp):
+    """Returns complete length of the recording from the Content-Range header 
+        ("bytes 0-99/200" or "bytes */200"), or None if it is unknown
+    """
+    content_range = resp.headers.get("content-range", "")
+    total = content_range.rsplit("/", 1)[-1]
+    return int(total) if total.isdigit() else None
+
+
+def requests_get_stream(url, stream=True, start=0, end=None):
+    """GET request for the recording stream, from byte {start} (up to byte {end}) if given
+    """
+    headers = {"Accept-Encoding": "identity"}
+    if start > 0 or end is not None:
+        headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+    return Http.get(url, stream=stream, headers=headers)
 
 
 def check_local_downloaded_file(fname:str):
     # check if file exists in local downloads folder
-    # print("Local file path: ", f"{PATH}{fname}")
-    if os.path.isfile(f"{PATH}{fname}"):
+    # print("Local file path: ", f"{Spool.path()}{fname}")
+    if os.path.isfile(f"{Spool.path()}{fname}"):
        # print("File exists")
-        file_size = os.path.getsize(f"{PATH}{fname}")
+        file_size = os.path.getsize(f"{Spool.path()}{fname}")
         # print("Local file size: ", file_size)
+        verified = g_verified_downloads.get(fname)
+        if verified is not None and verified["size"] and file_size != verified["size"]:
+            LOGGER.error(f"Downloaded file size {file_size} doesn't match content-length {verified['size']} -- {fname}")
+            return False
         if file_size > 0:
            # print("File is greater than 0 ")
             return True
@@ -278,26 +662,22 @@ def expected_uploads_list():
 def delete_local_downloads(downloads, unsuccessful_uploads_paths):
         for rec in downloads:
             if not rec in unsuccessful_uploads_paths:
-                os.unlink(rec)
+                Utils.remove_download(rec)
 
             
 def delete_successful_uploads_from_collab(
 successful_uploads_sessionIds: dict, recordingIds_date_created: dict):
-    delete_result = True
+    """Deletes the recordings of the successful uploads from Collab, all at once
+    Returns:
+        True if every deletion succeeded
+    """
+    rec_ids = []
     for ele in successful_uploads_sessionIds:
         for path, session_id in ele.items():
-            if len(recordingIds_date_created) > 0:
-                if remove_from_collab(path, recordingIds_date_created) != True:
-                    delete_result = False
-    return delete_result
-
-
-def remove_from_collab(path, recordingIds_date_created):
-    delete_result = True
-    for pair in recordingIds_date_created:
-        for rec_id, date in pair.items():
-            if rec_id in path: 
-                if WEBSERVICE.delete_recording_from_collab(rec_id) != True:
-                    delete_result = False
-    return delete_result
+            for pair in recordingIds_date_created:
+                for rec_id, date in pair.items():
+                    if rec_id in path and rec_id not in rec_ids:
+                        rec_ids.append(rec_id)
+    return all(result == True for result in WEBSERVICE.delete_recordings_batch(rec_ids))
+
 
@@ -58,7 +58,7 @@ def create_alert_message(trace_back: str):
     os.unlink("traceback.txt")
 
     # Attach log to message
-    with open(f"{BASE}/.logs/info.log", "rb") as attachment:
+    with open(f"{Logger.run_dir()}/.logs/info.log", "rb") as attachment:
         part = MIMEBase("application", "octet-stream")
         part.set_payload(attachment.read())
 
@@ -69,7 +69,7 @@ def create_alert_message(trace_back: str):
     message.attach(part)
 
     # Attach debug log to message
-    with open(f"{BASE}/.logs/dbg.log", "rb") as attachment:
+    with open(f"{Logger.run_dir()}/.logs/dbg.log", "rb") as attachment:
         part = MIMEBase("application", "octet-stream")
         part.set_payload(attachment.read())
 
@@ -0,0 +1,59 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from src.views import Logger
+from config import globalConfig
+
+LOGGER = Logger.init_logger(__name__)
+
+g_session = None
+g_session_lock = threading.Lock()
+
+
+def pool_size():
+    """Returns number of keep-alive connections kept per host: globalConfig.HttpPoolSize,
+        or if 0, enough for every download connection (DownloadConcurrency x DownloadSegments)
+        plus the pipeline uploads and API calls running alongside
+    """
+    if globalConfig.HttpPoolSize:
+        return globalConfig.HttpPoolSize
+    return globalConfig.DownloadConcurrency * globalConfig.DownloadSegments + globalConfig.PipelineUploadWorkers + 4
+
+
+def get_session():
+    """Returns the process wide requests session used for Collab API and recording stream (CDN) calls.
+        Connections are kept alive and reused, so DNS, TCP and TLS setup is only paid once per connection
+    """
+    global g_session
+    with g_session_lock:
+        if g_session is None:
+            LOGGER.debug(f"HTTP connection pool of {pool_size()} connections per host")
+            g_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size())
+            g_session.mount("https://", adapter)
+            g_session.mount("http://", adapter)
+        return g_session
+
+
+def timeout():
+    """(connect, read) timeout in seconds. The read timeout applies to every socket read,
+        so a stalled stream raises instead of hanging the run
+    """
+    return (globalConfig.HttpConnectTimeout, globalConfig.HttpReadTimeout)
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", timeout())
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, params=None, **kwargs):
+    return request("GET", url, params=params, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    return request("POST", url, data=data, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
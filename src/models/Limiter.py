@@ -32,13 +32,15 @@ class RateLimiter(object):
         return wrapped
 
     def __enter__(self):
-        """Context manager __enter__ to aquire threading lock
+        """Context manager __enter__ to aquire a call slot: waits while max_calls calls were made in
+           the last period, then records the call under the lock (concurrent callers can't share a slot)
         Returns:
             [obj]: 
         """
         with self._lock:
+            self._expire(time.time())
             if len(self.calls) >= self.max_calls:
-                until = time.time() + self.period - self._timespan
+                until = self.calls[0] + self.period
                 if self.callback:
                     t = threading.Thread(target=self.callback, args=(until,))
                     t.daemon = True
@@ -46,18 +48,16 @@ class RateLimiter(object):
                 sleeptime = until - time.time()
                 if sleeptime > 0:
                     time.sleep(sleeptime)
+                self._expire(time.time())
+            self.calls.append(time.time())
             return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager __exit__ to release threading lock
-        Returns:
-            [obj]: 
+        """Context manager __exit__, the call was recorded when its slot was aquired
         """
-        with self._lock:
-            self.calls.append(time.time())
-            while self._timespan >= self.period:
-                self.calls.popleft()
+        return None
 
-    @property
-    def _timespan(self):
-        return self.calls[-1] - self.calls[0]
+    def _expire(self, now):
+        # calls made more than one period ago no longer count
+        while self.calls and now - self.calls[0] >= self.period:
+            self.calls.popleft()
@@ -0,0 +1,159 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from config import globalConfig
+from src.models import HttpSession as Http
+from src.models.PanoptoOAuth2 import PanoptoOAuth2
+from src.views import Logger
+
+LOGGER = Logger.init_logger(__name__)
+
+# Time (in seconds) waited before retrying a throttled (429) or failed (500) Panopto call
+THROTTLED_WAIT = 10
+SERVER_ERROR_WAIT = 50
+
+
+class PanoptoClient:
+    """Process wide Panopto API client, shared by PanoptoUploader, PanoptoFolders, PanoptoSessions and Discover:
+        one pooled requests session, one access token (Resource Owner Grant) and one retry policy.
+        The token is only requested again once a call is refused with it (401, or a first 403).
+    """
+    def __init__(self, server, ssl_verify, oauth2, username, password):
+        self.server = server
+        self.ssl_verify = ssl_verify
+        self.oauth2 = oauth2
+        self.username = username
+        self.password = password
+        self.requests_session = requests.Session()
+        self.requests_session.verify = self.ssl_verify
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Http.pool_size())
+        self.requests_session.mount("https://", adapter)
+        self.access_token = None
+        self.token_lock = threading.Lock()
+
+    def get_token(self):
+        """Returns the shared access token, requested from Panopto on first call
+        """
+        with self.token_lock:
+            if self.access_token is None:
+                self.__setup_or_refresh_access_token()
+            return self.access_token
+
+    def refresh_token(self, refused_token):
+        """Requests a new access token once the current one was refused.
+            Calls refused with the same token at once only refresh it once
+        """
+        with self.token_lock:
+            if self.access_token == refused_token:
+                self.__setup_or_refresh_access_token()
+            return self.access_token
+
+    def __setup_or_refresh_access_token(self):
+        """
+        This method invokes OAuth2 Authorization Code Resource Owner Grant authorization flow.
+        It refreshes the access token with no browser required.
+        """
+        self.access_token = self.oauth2.get_access_token_resource_owner_grant(
+            self.username, self.password
+        )
+        if globalConfig.LogDetail == "Verbose":
+            LOGGER.debug(self.access_token)
+        else:
+            LOGGER.debug("")
+
+    def __check_retry_needed(self, response, token, attempt, forbidden_retried):
+        """
+        Inspect the response of a request call.
+        True indicates retry is needed, False indicates success. Otherwise an exception is thrown.
+
+        This method detects
+            - 401 (Unauthorized): token expired, refresh the access token and retry
+            - 403 (Forbidden): refresh the access token and retry once (forbidden_retried False),
+              a call still forbidden with a new token is not permitted to the user
+            - 429 (Too many requests) which means API throttling by the server, wait (Retry-After or 10 secs) and retry
+            - 500 (Internal server error), wait 50 secs and retry
+        up to globalConfig.PanoptoRetries times.
+        """
+        if response.status_code // 100 == 2:
+            # Success on 2xx responses.
+            return False
+
+        if attempt < globalConfig.PanoptoRetries:
+            if response.status_code == 401 or (response.status_code == 403 and not forbidden_retried):
+                print("Unauthorized. Refresh access token.")
+                LOGGER.debug("Unauthorized. Refresh access token.")
+                self.refresh_token(token)
+                return True
+
+            if response.status_code == 429:
+                retry_after = response.headers.get("Retry-After", "")
+                wait = int(retry_after) if retry_after.isdigit() else THROTTLED_WAIT
+                print(f"Too many requests. Wait {wait} secs, and retry.")
+                LOGGER.debug(f"Too many requests. Wait {wait} secs, and retry.")
+                time.sleep(wait)
+                return True
+
+            if response.status_code == 500:
+                print(f"Internal Server Error. Wait {SERVER_ERROR_WAIT} secs and retry.")
+                LOGGER.debug(f"Internal Server Error. Wait {SERVER_ERROR_WAIT} secs and retry.")
+                time.sleep(SERVER_ERROR_WAIT)
+                return True
+
+        # Throw unhandled cases.
+        response.raise_for_status()
+
+    def request(self, method, url, **kwargs):
+        """Panopto API call with the shared access token, retried as per __check_retry_needed
+        Returns:
+            response (2xx)
+        """
+        kwargs.setdefault("timeout", Http.timeout())
+        headers = dict(kwargs.pop("headers", None) or {})
+        attempt = 0
+        forbidden_retried = False
+        while True:
+            token = self.get_token()
+            headers["Authorization"] = "Bearer " + token
+            resp = self.requests_session.request(method, url, headers=headers, **kwargs)
+            if not self.__check_retry_needed(resp, token, attempt, forbidden_retried):
+                return resp
+            forbidden_retried = forbidden_retried or resp.status_code == 403
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+g_panopto_client = None
+g_panopto_client_lock = threading.Lock()
+
+
+def get_panopto_client():
+    """Returns the process wide PanoptoClient (Config.credentials Panopto server and user)
+    """
+    global g_panopto_client
+    with g_panopto_client_lock:
+        if g_panopto_client is None:
+            server = Config.credentials["ppto_server"]
+            ssl_verify = True
+            oauth2 = PanoptoOAuth2(
+                server,
+                Config.credentials["ppto_client_id"],
+                Config.credentials["ppto_client_secret"],
+                ssl_verify,
+            )
+            g_panopto_client = PanoptoClient(
+                server, ssl_verify, oauth2, Config.credentials["ppto_username"], Config.credentials["ppto_password"]
+            )
+        return g_panopto_client
@@ -1,13 +1,15 @@
 import os
-from oauthlib import oauth2
 import requests
 import codecs
 import time
 import datetime as dt
 import copy
 import boto3  # AWS SDK (boto3)
+import tempfile
+import shutil
 import urllib3
 from src.views import Logger
+from src.models import HttpSession as Http
 from config import globalConfig
 
 LOGGER = Logger.init_logger(__name__)
@@ -32,61 +34,20 @@ UPLOAD_STATUS = {
 }
 
 class PanoptoUploader:
-    def __init__(
-        self, server, ssl_verify, oauth2, username, password
-    ):  # mbk added username pass for user auth.
+    def __init__(self, client):
         """
         Constructor of uploader instance. 
-        This goes through authorization step of the target server.
-        """
-        self.server = server
-        self.ssl_verify = ssl_verify
-        self.oauth2 = oauth2
-        self.username = username  # mbk for 2lo
-        self.password = password  # mbk for 2lo
-        self.requests_session = requests.Session()
-        self.requests_session.verify = self.ssl_verify
-        self.__setup_or_refresh_access_token()
-
-    def __setup_or_refresh_access_token(
-        self,
-    ):  # Used for 3LO flow... we're going to just get a token with 2LO
-        """
-        This method invokes OAuth2 Authorization Code Resource Owner Grant authorization flow.
-        It refreshes the access token with no browser required.
-        This is called at the initialization of the class, as well as when 401 (Unaurhotized) is returend.
-        """
-        access_token = self.oauth2.get_access_token_resource_owner_grant(
-            self.username, self.password
-        )
-        self.requests_session.headers.update(
-            {"Authorization": "Bearer " + access_token}
-        )
-        if globalConfig.LogDetail == "Verbose":
-            LOGGER.debug(access_token) 
-        else:
-            LOGGER.debug("")
-            
-    def __check_retry_needed(self, response):
-        """
-        Inspect the response of a request call.
-        True indicates retry needed, False indicates success. Otherwise an exception is thrown.
+        Calls go through the shared Panopto client (session, access token and retries).
         """
-        LOGGER.debug("")
-        if response.status_code // 100 == 2:
-            return False
-
-        if response.status_code == requests.codes.forbidden:
-            LOGGER.debug(
-                "Forbidden. This may mean token expired. Refresh access token."
-            )
-            self.__setup_or_refresh_access_token()  # NEW JBRUYLANT 280621
-            return True
-
-        response.raise_for_status()
+        self.client = client
+        self.server = client.server
+        self.ssl_verify = client.ssl_verify
 
-    def upload(self, file_path, date_created, folder_id):
+    def upload(self, file_path, date_created, folder_id, stream_url=None):
         """Main upload method to go through all required steps.
+            If stream_url is given (Stream transfer mode), the recording is read from the Collab stream
+            instead of the local file_path, which is then only used for naming.
+            stream_url is either the url or a callable issuing it when the transfer starts (private recordings)
         Returns:
             dict: {"Status_Value": int, "Status_Name": str}. Indicates how the upload went
         """
@@ -94,9 +55,23 @@ class PanoptoUploader:
         session_upload = self.__create_session(folder_id)
         upload_id = session_upload["ID"]
         upload_target = session_upload["UploadTarget"]
-        self.__multipart_upload_single_file(upload_target, file_path)
-        self.__create_manifest_for_video(file_path, date_created, MANIFEST_FILE_NAME)
-        self.__multipart_upload_single_file(upload_target, MANIFEST_FILE_NAME)
+        if stream_url is None:
+            self.__multipart_upload_single_file(upload_target, file_path)
+        else:
+            try:
+                self.__multipart_upload_stream(upload_target, file_path, stream_url)
+            except (IOError, requests.exceptions.RequestException) as e:
+                LOGGER.error(f"Streamed upload failed: {e}")
+                self.__cancel_upload(session_upload)
+                return {"Status_Value": 2, "Status_Name": UPLOAD_STATUS[2]}
+        # manifest generated in its own directory as several uploads can run at once
+        manifest_dir = tempfile.mkdtemp()
+        manifest_file = os.path.join(manifest_dir, MANIFEST_FILE_NAME)
+        try:
+            self.__create_manifest_for_video(file_path, date_created, manifest_file)
+            self.__multipart_upload_single_file(upload_target, manifest_file)
+        finally:
+            shutil.rmtree(manifest_dir, ignore_errors=True)
         self.__finish_upload(session_upload)
         upload_status = self.__monitor_progress(upload_id) 
 
@@ -110,31 +85,24 @@ class PanoptoUploader:
             [obj]: sessionUpload object
         """
         LOGGER.debug("")
-        while True:
-            print("Calling POST PublicAPI/REST/sessionUpload endpoint")
-            url = f"https://{self.server}/Panopto/PublicAPI/REST/sessionUpload"
-            payload = {"FolderId": folder_id}
-            headers = {"content-type": "application/json"}
-            resp = self.requests_session.post(url=url, json=payload, headers=headers)
-            if not self.__check_retry_needed(resp):
-                break
+        print("Calling POST PublicAPI/REST/sessionUpload endpoint")
+        url = f"https://{self.server}/Panopto/PublicAPI/REST/sessionUpload"
+        payload = {"FolderId": folder_id}
+        headers = {"content-type": "application/json"}
+        resp = self.client.post(url=url, json=payload, headers=headers)
 
         return resp.json()
 
-    def __multipart_upload_single_file(self, upload_target, file_path):
+    def __s3_client(self, upload_target, file_path):
         """
-        Upload a single file by using Multipart upload protocol.
-        We use AWS SDK (boto3) underneath for this step.
+        Returns boto3 S3 client, bucket and object key for the file in the upload target.
         """
-        LOGGER.debug("")
         elements = upload_target.split("/")
         service_endpoint = "/".join(elements[0:-2:])
         bucket = elements[-2]
         prefix = elements[-1]
         object_key = "{0}/{1}".format(prefix, os.path.basename(file_path))
 
-        print(f"Upload {file_path} with multipart upload protocol")
-
         s3 = boto3.session.Session().client(
             service_name="s3",
             endpoint_url=service_endpoint,
@@ -142,6 +110,17 @@ class PanoptoUploader:
             aws_access_key_id="dummy",
             aws_secret_access_key="dummy",
         )
+        return s3, bucket, object_key
+
+    def __multipart_upload_single_file(self, upload_target, file_path):
+        """
+        Upload a single file by using Multipart upload protocol.
+        We use AWS SDK (boto3) underneath for this step.
+        """
+        LOGGER.debug("")
+        print(f"Upload {file_path} with multipart upload protocol")
+
+        s3, bucket, object_key = self.__s3_client(upload_target, file_path)
 
         mpu = s3.create_multipart_upload(Bucket=bucket, Key=object_key)
         mpu_id = mpu["UploadId"]
@@ -173,6 +152,81 @@ class PanoptoUploader:
             MultipartUpload={"Parts": parts},
         )
 
+    def __multipart_upload_stream(self, upload_target, file_path, stream_url):
+        """
+        Upload a recording straight from its Collab stream by using Multipart upload protocol.
+        The stream is cut into PART_SIZE parts as it arrives, so no local copy is made.
+        The multipart upload is aborted if the stream ends before its content-length.
+        """
+        LOGGER.debug("")
+        print(f"Stream {os.path.basename(file_path)} with multipart upload protocol")
+
+        resp = self.__open_stream(stream_url)
+        resp.raise_for_status()
+        total_bytes = int(resp.headers.get("content-length", 0))
+
+        s3, bucket, object_key = self.__s3_client(upload_target, file_path)
+
+        mpu = s3.create_multipart_upload(Bucket=bucket, Key=object_key)
+        mpu_id = mpu["UploadId"]
+        parts = []
+        transferred_bytes = 0
+        buffer = bytearray()
+
+        def upload_part(data):
+            part_number = len(parts) + 1
+            part = s3.upload_part(
+                Body=bytes(data),
+                Bucket=bucket,
+                Key=object_key,
+                UploadId=mpu_id,
+                PartNumber=part_number,
+            )
+            parts.append({"PartNumber": part_number, "ETag": part["ETag"]})
+
+        try:
+            for data in resp.iter_content(chunk_size=globalConfig.DownloadChunkSize):
+                buffer += data
+                while len(buffer) >= PART_SIZE:
+                    upload_part(buffer[:PART_SIZE])
+                    del buffer[:PART_SIZE]
+                    transferred_bytes += PART_SIZE
+                    print(f"-- {transferred_bytes} of {total_bytes} bytes transferred")
+            if len(buffer) or not parts:
+                upload_part(buffer)
+                transferred_bytes += len(buffer)
+                print(f"-- {transferred_bytes} of {total_bytes} bytes transferred")
+            if total_bytes and transferred_bytes != total_bytes:
+                raise IOError(f"Incomplete stream: {transferred_bytes} of {total_bytes} bytes received")
+        except Exception:
+            s3.abort_multipart_upload(Bucket=bucket, Key=object_key, UploadId=mpu_id)
+            raise
+
+        result = s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=object_key,
+            UploadId=mpu_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def __open_stream(self, stream_url):
+        """Opens the Collab stream. A url issuer is called at transfer start, 
+            and once more for a new url if the issued one is refused (403)
+        """
+        issue_url = stream_url if callable(stream_url) else None
+        url = issue_url() if issue_url is not None else stream_url
+        if url is None:
+            raise IOError("No recording url issued by Collab")
+        resp = Http.get(url, stream=True, headers={"Accept-Encoding": "identity"})
+        if resp.status_code == 403 and issue_url is not None:
+            resp.close()
+            LOGGER.warning("Recording url refused, issuing a new one")
+            url = issue_url(True)
+            if url is None:
+                raise IOError("No recording url issued by Collab")
+            resp = Http.get(url, stream=True, headers={"Accept-Encoding": "identity"})
+        return resp
+
     # TODO This is where we can add custom description to our video uploads
     def __create_manifest_for_video(self, file_path, date_created, manifest_file_name):
         """ Creates manifest XML file for a single video file, based on template.
@@ -202,17 +256,26 @@ class PanoptoUploader:
         upload_id = session_upload["ID"]
         upload_target = session_upload["UploadTarget"]
 
-        while True:
-            url = f"https://{self.server}/Panopto/PublicAPI/REST/sessionUpload/{upload_id}"
-            payload = copy.copy(session_upload)
-            payload["State"] = 1
-            headers = {"content-type": "application/json"}
-            resp = self.requests_session.put(url=url, json=payload, headers=headers)
-            if not self.__check_retry_needed(resp):
-                break
+        url = f"https://{self.server}/Panopto/PublicAPI/REST/sessionUpload/{upload_id}"
+        payload = copy.copy(session_upload)
+        payload["State"] = 1
+        headers = {"content-type": "application/json"}
+        self.client.put(url=url, json=payload, headers=headers)
 
         print("Waiting for upload to complete, this can take a while...")
 
+    def __cancel_upload(self, session_upload):
+        """
+        Cancel upload (used when a streamed transfer fails).
+        """
+        upload_id = session_upload["ID"]
+
+        url = f"https://{self.server}/Panopto/PublicAPI/REST/sessionUpload/{upload_id}"
+        payload = copy.copy(session_upload)
+        payload["State"] = 2
+        headers = {"content-type": "application/json"}
+        self.client.put(url=url, json=payload, headers=headers)
+
     def __monitor_progress(self, upload_id):
         """
         Polling status API until process completes.
@@ -223,9 +286,7 @@ class PanoptoUploader:
         while True:
             time.sleep(20)
             url = f"https://{self.server}/Panopto/PublicAPI/REST/sessionUpload/{upload_id}"
-            resp = self.requests_session.get(url=url)
-            if self.__check_retry_needed(resp):
-                continue
+            resp = self.client.get(url=url)
             session_upload = resp.json()
             state = int(session_upload["State"])
             if state != previous_state:
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from src.views import Logger
+from config import globalConfig
+
+LOGGER = Logger.init_logger(__name__)
+
+# kinds of cached Collab responses
+RECORDING = "recording"  # recording object (/recordings/{id})
+PUBLIC_DATA = "data"     # public recording data (/recordings/{id}/data)
+
+g_connection = None
+g_lock = threading.Lock()
+
+
+def enabled():
+    return globalConfig.RecordingCacheTTL > 0
+
+
+def connection():
+    """Opens the cache database (globalConfig.RecordingCachePath) on first use, purging expired entries
+    """
+    global g_connection
+    if g_connection is None:
+        os.makedirs(os.path.dirname(os.path.abspath(globalConfig.RecordingCachePath)), exist_ok=True)
+        g_connection = sqlite3.connect(globalConfig.RecordingCachePath, check_same_thread=False)
+        g_connection.execute(
+            "CREATE TABLE IF NOT EXISTS recordings "
+            "(recording_id TEXT, kind TEXT, data TEXT, fetched REAL, PRIMARY KEY (recording_id, kind))"
+        )
+        g_connection.execute("DELETE FROM recordings WHERE fetched < ?", (time.time() - globalConfig.RecordingCacheTTL,))
+        g_connection.commit()
+    return g_connection
+
+
+def get(kind: str, recording_id: str):
+    """Returns cached json dict, or None if not cached or older than globalConfig.RecordingCacheTTL seconds
+    """
+    return get_many(kind, [recording_id]).get(recording_id)
+
+
+def get_many(kind: str, recording_ids: list):
+    """Returns {recording_id: json dict} of the recordings cached and not expired
+    """
+    if not enabled() or not recording_ids:
+        return {}
+    cached = {}
+    with g_lock:
+        db = connection()
+        for start in range(0, len(recording_ids), 500):
+            chunk = recording_ids[start:start + 500]
+            rows = db.execute(
+                f"SELECT recording_id, data FROM recordings WHERE kind = ? AND fetched >= ? "
+                f"AND recording_id IN ({','.join('?' * len(chunk))})",
+                (kind, time.time() - globalConfig.RecordingCacheTTL, *chunk),
+            )
+            cached.update((recording_id, json.loads(data)) for recording_id, data in rows)
+    return cached
+
+
+def put(kind: str, recording_id: str, data: dict):
+    if not enabled() or data is None:
+        return
+    with g_lock:
+        db = connection()
+        db.execute(
+            "INSERT OR REPLACE INTO recordings (recording_id, kind, data, fetched) VALUES (?, ?, ?, ?)",
+            (recording_id, kind, json.dumps(data), time.time()),
+        )
+        db.commit()
+
+
+def invalidate(recording_id: str, kind: str = None):
+    """Removes cached responses of the recording (of every kind if no kind given),
+        e.g. once deleted from Collab or not found (404)
+    """
+    if not enabled():
+        return
+    with g_lock:
+        db = connection()
+        if kind is None:
+            db.execute("DELETE FROM recordings WHERE recording_id = ?", (recording_id,))
+        else:
+            db.execute("DELETE FROM recordings WHERE recording_id = ? AND kind = ?", (recording_id, kind))
+        db.commit()
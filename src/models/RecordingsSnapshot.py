@@ -0,0 +1,178 @@
+import os
+import time
+import sqlite3
+import threading
+from src.models import Utilities as Utils
+from src.views import Logger
+from config import globalConfig
+
+LOGGER = Logger.init_logger(__name__)
+
+g_connection = None
+g_lock = threading.Lock()
+# windows refreshed from the DB by this process (globalConfig.DbSnapshotRefresh)
+g_refreshed = set()
+
+INSERT_BATCH = 1000
+
+
+def connection():
+    """Opens the snapshot database (globalConfig.DbSnapshotPath) on first use.
+        Rows are kept per window (start_date, end_date, course label filter) they were returned for
+    """
+    global g_connection
+    if g_connection is None:
+        os.makedirs(os.path.dirname(os.path.abspath(globalConfig.DbSnapshotPath)), exist_ok=True)
+        g_connection = sqlite3.connect(globalConfig.DbSnapshotPath, check_same_thread=False)
+        columns = [column[1] for column in g_connection.execute("PRAGMA table_info(eligible_recordings)")]
+        if columns and "window_label" not in columns:
+            # snapshot of an earlier version (rows not tagged with their window): taken again
+            g_connection.executescript("DROP TABLE eligible_recordings; DROP TABLE IF EXISTS windows;")
+        g_connection.executescript(
+            "CREATE TABLE IF NOT EXISTS eligible_recordings "
+            "(start_date TEXT, end_date TEXT, window_label TEXT, "
+            "course_label TEXT, recording_id TEXT, creation_date TEXT, course_name TEXT, "
+            "PRIMARY KEY (start_date, end_date, window_label, course_label, recording_id));"
+            "CREATE INDEX IF NOT EXISTS eligible_recordings_label_date "
+            "ON eligible_recordings (course_label, creation_date, start_date, end_date, window_label);"
+            "CREATE TABLE IF NOT EXISTS windows "
+            "(start_date TEXT, end_date TEXT, course_label TEXT, taken REAL, "
+            "PRIMARY KEY (start_date, end_date, course_label));"
+            "CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT);"
+        )
+    return g_connection
+
+
+def enabled():
+    return globalConfig.DbSnapshot == "Yes"
+
+
+def covering_window(start_date, end_date, course_label):
+    """Returns snapshot window the requested one is served from: the same window, or for a course label
+        the same dates taken for all courses (rows filtered on their course label).
+        Only windows taken less than globalConfig.DbSnapshotMaxAge hours ago, otherwise None
+    """
+    if globalConfig.DbSnapshotRefresh == "Yes" and (start_date, end_date, course_label) not in g_refreshed:
+        # explicit refresh: the DB is queried once per window by this run (not again after a restart)
+        if not Utils.is_restarted():
+            return None
+    row = connection().execute(
+        "SELECT start_date, end_date, course_label FROM windows WHERE start_date = ? AND end_date = ? "
+        "AND course_label IN ('', ?) AND taken >= ? ORDER BY course_label DESC, taken DESC LIMIT 1",
+        (start_date, end_date, course_label, time.time() - globalConfig.DbSnapshotMaxAge * 3600),
+    ).fetchone()
+    return row
+
+
+def read(start_date, end_date, course_label):
+    """Returns rows of the window from the snapshot (as the stored procedure returns them), or None if not covered.
+        Rows are read globalConfig.DbFetchSize at a time as they are consumed
+    Returns:
+        generator of rows, or None
+    """
+    with g_lock:
+        if not enabled():
+            return None
+        window = covering_window(start_date, end_date, course_label)
+        if window is None:
+            return None
+        sql = (
+            "SELECT course_label, recording_id, creation_date, course_name FROM eligible_recordings "
+            "WHERE start_date = ? AND end_date = ? AND window_label = ?"
+        )
+        params = window
+        if course_label != window[2]:
+            sql += " AND course_label = ?"
+            params += (course_label,)
+        cursor = connection().execute(sql + " ORDER BY course_label, creation_date", params)
+    LOGGER.info(f"Eligible recordings read from snapshot for {course_label or 'all courses'} {start_date} - {end_date}")
+    return stream(cursor)
+
+
+def stream(cursor):
+    while True:
+        with g_lock:
+            rows = cursor.fetchmany(globalConfig.DbFetchSize)
+        if not rows:
+            return
+        yield from rows
+
+
+def record(start_date, end_date, course_label, rows):
+    """Writes rows streamed from the DB to the snapshot while passing them on.
+        The window is only recorded as covered once all its rows have been written
+    Returns:
+        generator of rows
+    """
+    if not enabled():
+        yield from rows
+        return
+
+    discard(start_date, end_date, course_label)
+    batch = []
+    for row in rows:
+        batch.append((start_date, end_date, course_label, row[0], row[1], str(row[2]), row[3]))
+        if len(batch) >= INSERT_BATCH:
+            write(batch)
+            batch = []
+        yield row
+    write(batch)
+    with g_lock:
+        db = connection()
+        db.execute(
+            "INSERT OR REPLACE INTO windows (start_date, end_date, course_label, taken) VALUES (?, ?, ?, ?)",
+            (start_date, end_date, course_label, time.time()),
+        )
+        db.commit()
+        g_refreshed.add((start_date, end_date, course_label))
+
+
+def discard(start_date, end_date, course_label):
+    """Removes the window about to be refreshed and its rows (no longer covered until the refresh is complete)
+    """
+    with g_lock:
+        db = connection()
+        db.execute(
+            "DELETE FROM eligible_recordings WHERE start_date = ? AND end_date = ? AND window_label = ?",
+            (start_date, end_date, course_label),
+        )
+        db.execute(
+            "DELETE FROM windows WHERE start_date = ? AND end_date = ? AND course_label = ?",
+            (start_date, end_date, course_label),
+        )
+        db.commit()
+
+
+def check_blacklist(blacklisted_courses):
+    """Discards the whole snapshot when the course blacklist has changed since it was taken:
+        rows are stored after the DB feed exclusions, so courses taken off the blacklist would be missing
+    Args:
+        blacklisted_courses (iterable): course labels
+    """
+    if not enabled():
+        return
+    blacklist = "\n".join(sorted(blacklisted_courses))
+    with g_lock:
+        db = connection()
+        row = db.execute("SELECT value FROM settings WHERE name = 'blacklist'").fetchone()
+        if row is not None and row[0] == blacklist:
+            return
+        if row is not None:
+            LOGGER.info("Course blacklist changed: eligible recordings snapshot discarded")
+        db.execute("DELETE FROM eligible_recordings")
+        db.execute("DELETE FROM windows")
+        db.execute("INSERT OR REPLACE INTO settings (name, value) VALUES ('blacklist', ?)", (blacklist,))
+        db.commit()
+
+
+def write(batch):
+    if not batch:
+        return
+    with g_lock:
+        db = connection()
+        db.executemany(
+            "INSERT OR REPLACE INTO eligible_recordings "
+            "(start_date, end_date, window_label, course_label, recording_id, creation_date, course_name) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", batch
+        )
+        db.commit()
@@ -0,0 +1,98 @@
+import os
+import time
+import shutil
+import threading
+from src.views import Logger
+from config import globalConfig
+
+LOGGER = Logger.init_logger(__name__)
+
+# Time (in seconds) between disk space re-checks while a download waits for admission
+WAIT_INTERVAL = 30
+
+# {recording filename: [reserved bytes, written]}
+g_reservations = {}
+g_condition = threading.Condition()
+
+
+def path():
+    """Returns the spool folder recordings are downloaded to (globalConfig.SpoolPath),
+        with trailing separator. The folder is created if it doesn't exist
+    """
+    spool_path = os.path.join(globalConfig.SpoolPath, "")
+    os.makedirs(spool_path, exist_ok=True)
+    return spool_path
+
+
+def course_of(filename: str):
+    """Returns course part of a download filename (course_label#recording_id#recording_name.mp4)
+    """
+    return filename.split("#")[0]
+
+
+def reserve(filename: str, size: int):
+    """Admission control for a download: reserves {size} bytes in the spool before the download starts.
+        Waits until the reservation fits within globalConfig.SpoolQuota and the free disk space
+        (less globalConfig.SpoolHeadroom and the bytes still to be written by admitted downloads).
+        A recording is always admitted above quota if the disk has space for it and the spool only holds 
+        recordings of its own course: a course's reservations are released once the course is uploaded,
+        so a course larger than the quota would otherwise wait for itself.
+        A download still waiting after globalConfig.SpoolMaxWait seconds is not admitted.
+    Args:
+        filename (str): download filename
+        size (int): expected size of the recording (Collab storageSize)
+    Returns:
+        bool: True once admitted, False if the disk can't hold the recording even with an empty spool
+            or no space was released in time
+    """
+    size = size or 0
+    deadline = time.monotonic() + globalConfig.SpoolMaxWait
+    with g_condition:
+        waiting = False
+        while True:
+            reserved = sum(reservation[0] for reservation in g_reservations.values())
+            outstanding = sum(reservation[0] for reservation in g_reservations.values() if not reservation[1])
+            free = shutil.disk_usage(path()).free - globalConfig.SpoolHeadroom - outstanding
+            within_quota = not globalConfig.SpoolQuota or reserved + size <= globalConfig.SpoolQuota
+            own_course_only = all(course_of(reserved_file) == course_of(filename) for reserved_file in g_reservations)
+            if size <= free and (within_quota or own_course_only):
+                g_reservations[filename] = [size, False]
+                if waiting:
+                    LOGGER.info(f"Spool space available -- {filename}")
+                return True
+            if not g_reservations:
+                LOGGER.error(f"Not enough disk space in {path()} for {filename} ({size} bytes)")
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                LOGGER.error(
+                    f"No spool space released within {globalConfig.SpoolMaxWait} secs ({size} bytes, {reserved} reserved) -- {filename}"
+                )
+                return False
+            if not waiting:
+                LOGGER.info(f"Waiting for spool space ({size} bytes, {reserved} reserved) -- {filename}")
+                waiting = True
+            g_condition.wait(min(WAIT_INTERVAL, remaining))
+
+
+def commit(filename: str):
+    """Marks download as fully written: its bytes are on disk, no longer still to be written
+    """
+    with g_condition:
+        if filename in g_reservations:
+            g_reservations[filename][1] = True
+            g_condition.notify_all()
+
+
+def release(filename: str):
+    """Releases the reservation of a recording removed from the spool (deleted, failed or kept out of spool)
+    """
+    with g_condition:
+        if g_reservations.pop(filename, None) is not None:
+            LOGGER.debug(f"Released spool space -- {filename}")
+            g_condition.notify_all()
+
+
+def reserved_bytes():
+    with g_condition:
+        return sum(reservation[0] for reservation in g_reservations.values())
@@ -5,7 +5,7 @@ import time
 from config import Config
 from src.views import Logger
 from src.models.PanoptoFolders import PanoptoFolders
-from src.models.PanoptoOAuth2 import PanoptoOAuth2
+from src.models import PanoptoClient
 from src.models.PanoptoUploader import PanoptoUploader
 from src.models.PanoptoSessions import PanoptoSessions
 from src.models.Discover import Discover
@@ -18,47 +18,14 @@ LOGGER = Logger.init_logger(__name__)
 
 class Uploads:
     def __init__(self) -> None:
-        self.__ppto_server = Config.credentials["ppto_server"]
-        self.__ppto_client_id = Config.credentials["ppto_client_id"]
-        self.__ppto_client_secret = Config.credentials["ppto_client_secret"]
-        self.__ppto_username = Config.credentials["ppto_username"]
-        self.__ppto_password = Config.credentials["ppto_password"]
-        self.__ssl_verify = True
-
-        self.oauth2 = PanoptoOAuth2(
-            self.__ppto_server,
-            self.__ppto_client_id,
-            self.__ppto_client_secret,
-            self.__ssl_verify,
-        )
-        self.uploader = PanoptoUploader(
-            self.__ppto_server,
-            self.__ssl_verify,
-            self.oauth2,
-            self.__ppto_username,
-            self.__ppto_password,
-        )
-        self.folders = PanoptoFolders(
-            self.__ppto_server,
-            self.__ssl_verify,
-            self.oauth2,
-            self.__ppto_username,
-            self.__ppto_password,
-        )
-        self.sessions = PanoptoSessions(
-            self.__ppto_server,
-            self.__ssl_verify,
-            self.oauth2,
-            self.__ppto_username,
-            self.__ppto_password,
-        )
-        self.Discover = Discover(
-            self.__ppto_server,
-            self.__ssl_verify,
-            self.oauth2,
-            self.__ppto_username,
-            self.__ppto_password,
-        )
+        """Panopto API handlers, all sharing the process wide Panopto client
+            (one session and one access token: constructing Uploads makes no API call)
+        """
+        self.client = PanoptoClient.get_panopto_client()
+        self.uploader = PanoptoUploader(self.client)
+        self.folders = PanoptoFolders(self.client)
+        self.sessions = PanoptoSessions(self.client)
+        self.Discover = Discover(self.client)
 
     def upload_video(
         self, file_path: str, date_created: str, ppto_folder_id: str
@@ -76,7 +43,9 @@ class Uploads:
         file_name = os.path.basename(file_path)
         LOGGER.info(f"Uploading {file_name} => {ppto_folder_id}")
 
-        return self.uploader.upload(file_path, date_created, ppto_folder_id)
+        return self.uploader.upload(
+            file_path, date_created, ppto_folder_id, Utils.get_stream_source(file_path)
+        )
 
     def get_folder_id_from_course_info(self, course_label: str, course_name: str) -> str:
         """Retrieves folder ID in PPTO from given course name or course label.
@@ -237,7 +206,7 @@ class Uploads:
                             print("  Failed upload - could not be deleted ")
                             LOGGER.warning("Failed upload - could not be deleted ")        
                         
-                        os.unlink(path)
+                        Utils.remove_download(path)
                         print("  Failed upload deleted locally")
                         LOGGER.warning("Failed upload deleted locally")
                     except Exception as e:
@@ -245,7 +214,7 @@ class Uploads:
                         print("Deletion failed. {0}".format(e))
                         LOGGER.error("Deletion failed. {0}".format(e))
                         
-                        os.unlink(path)
+                        Utils.remove_download(path)
                         print("  Failed upload deleted locally")
                         LOGGER.warning("Failed upload deleted locally")
                 else:
@@ -6,7 +6,11 @@ import json
 import re
 import os,sys
 import csv
+import threading
+import atexit
 from src.models.Uploads import Uploads
+from src.models import Spool
+from src.models import HttpSession as Http
 from src.models import Emails as Email
 from src.views import Logger
 from config import Config
@@ -15,9 +19,24 @@ from config import globalConfig
 BASE = os.getcwd()
 LOGGER = Logger.init_logger(__name__)
 
-g_current_course_label = ''
+# course label currently downloaded or uploaded, kept per thread (download and upload stages run in parallel)
+g_current_course = threading.local()
 
 g_undiscovered_course_folders = {}
+# guards g_undiscovered_course_folders (updated by the upload workers in parallel)
+g_undiscovered_lock = threading.Lock()
+
+# guards the load-update-save of courseLabel_folderId_pairs.json (upload workers update it in parallel)
+g_folder_pairs_lock = threading.Lock()
+
+# {recording filename: Collab stream url} for recordings transferred in Stream mode (no local file)
+g_stream_sources = {}
+
+# set in the environment of the process re-executed by run_restart
+RESTART_ENV = "COLLAB2PANOPTO_RESTART"
+
+# functions releasing resources (e.g. DB connections) before the process exits or restarts
+g_shutdown_hooks = []
 
 
 def logger_msg(*vars):
@@ -178,9 +197,7 @@ def return_download_filename(course_label, rec, filetype):
         LOGGER.debug("")
     handle_types(*[(course_label, ""), (rec, {}), (filetype, "")])
     
-    # assigning value to module-scope variable
-    global g_current_course_label
-    g_current_course_label = course_label
+    set_current_course_label(course_label)
 
     filename = ''
     try:
@@ -219,9 +236,7 @@ def return_download_filename_db(course_label, rec_id, rec, filetype):
         LOGGER.debug("")
     handle_types(*[(course_label, ""),(rec_id, ""), (rec,{}), (filetype, "")])
     
-    # assigning value to module-scope variable
-    global g_current_course_label
-    g_current_course_label = course_label
+    set_current_course_label(course_label)
 
     filename = ''
     try:
@@ -239,6 +254,19 @@ def return_download_filename_db(course_label, rec_id, rec, filetype):
     return filename
 
 
+def recording_id_from_filename(filename: str):
+    """Returns recording id from download filename (course_label#recording_id#recording_name.mp4), or '' 
+    """
+    parts = os.path.basename(filename).split("#")
+    return parts[1] if len(parts) >= 3 else ''
+
+
+def set_current_course_label(course_label: str):
+    g_current_course.label = course_label
+
+def current_course_label():
+    return getattr(g_current_course, "label", '')
+
 def rename_recording(composed_name, courseLabel = ''): 
     """ Recordings are renamed on PPTO after being uploaded and discovered.
         If recording is in default PPTO folder, add label to recording name as prefix
@@ -247,12 +275,12 @@ def rename_recording(composed_name, courseLabel = ''):
         composed_name (downloaded file name): str
         courseLabel : optional, used in re-discover function
     Returns:
-        recording_renamed: str
+        recording_renamed: str ('' if the course label has no PPTO folder in the lookup file: not to be renamed)
     """
     recording_renamed = ''
 
     if '#' in composed_name:
-        course_label = g_current_course_label if courseLabel == '' else courseLabel
+        course_label = current_course_label() if courseLabel == '' else courseLabel
         courseLabel_folderId_pairs = check_json_courselabel_folderid_pairs()
 
         if course_label in courseLabel_folderId_pairs.keys():
@@ -260,6 +288,9 @@ def rename_recording(composed_name, courseLabel = ''):
                 recording_renamed = course_label + "-" + composed_name.split("#")[2] 
             else:
                 recording_renamed = composed_name.split("#")[2] 
+        else:
+            LOGGER.warning(f"No PPTO folder found for {course_label} in lookup file, not renamed -- {composed_name}")
+            return ''
 
         # PPTO recording name excludes file extension
         p = recording_renamed.find(".mp4")
@@ -285,6 +316,7 @@ def get_courseLabel_folderId_pairs(course_label_names: list):
     courseLabel_folderId_pairs = check_json_courselabel_folderid_pairs()
 
     missing_folders_list = []
+    found_pairs = {}
     for courseLabel, courseName in course_label_names:
         if courseLabel in courseLabel_folderId_pairs.keys():
             continue
@@ -294,12 +326,16 @@ def get_courseLabel_folderId_pairs(course_label_names: list):
             # Thanks to the addition of the default PPTO folder
             if folderId is not None:
                 # Adding missing pairs to json file
-                courseLabel_folderId_pairs[courseLabel] = folderId
+                found_pairs[courseLabel] = folderId
             else:
                 # This will only be the case if the default PPTO folder is deleted
                 missing_folders_list.append(courseLabel)
 
-    save_json_courselabel_folderid_pairs(courseLabel_folderId_pairs, f"{BASE}/data")
+    # merged into the file as it is now: pairs saved by other upload workers since it was read are kept
+    with g_folder_pairs_lock:
+        courseLabel_folderId_pairs = check_json_courselabel_folderid_pairs()
+        courseLabel_folderId_pairs.update(found_pairs)
+        save_json_courselabel_folderid_pairs(courseLabel_folderId_pairs, f"{Logger.run_dir()}/data")
 
     return courseLabel_folderId_pairs, missing_folders_list
 
@@ -315,8 +351,11 @@ def save_json_courselabel_folderid_pairs(courseLabel_folderId_pairs, json_dir_pa
         LOGGER.debug("")
     handle_types(*[(courseLabel_folderId_pairs, {}), (json_dir_path, "")])
     dir = create_dir_if_not_exists(json_dir_path)
-    with open(f"{dir}/courseLabel_folderId_pairs.json", "w") as fp:
+    # written to a temporary file first, as upload workers may save or read the file at the same time
+    tmp_path = f"{dir}/courseLabel_folderId_pairs.json.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "w") as fp:
         json.dump(courseLabel_folderId_pairs, fp, indent=4)
+    os.replace(tmp_path, f"{dir}/courseLabel_folderId_pairs.json")
 
     return courseLabel_folderId_pairs
 
@@ -340,13 +379,39 @@ def create_dir_if_not_exists(path: str):
 
     return path
 
+def save_run_summary(summary_path: str, summary: dict):
+    """Saves run summary as json (written once the run is complete: backfill shard checkpoint)
+    Args:
+        summary_path (str): json file path
+        summary (dict): counts and lists of the end of run summary
+    """
+    LOGGER.debug(f"{summary_path}")
+    create_dir_if_not_exists(os.path.dirname(os.path.abspath(summary_path)))
+    tmp_path = f"{summary_path}.{os.getpid()}"
+    with open(tmp_path, "w") as fp:
+        json.dump(summary, fp, indent=4, default=str)
+    os.replace(tmp_path, summary_path)
+
+
+def load_run_summary(summary_path: str):
+    """Loads run summary saved by save_run_summary
+    Returns:
+        dict, or None if the run hasn't completed
+    """
+    try:
+        with open(summary_path) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
 def check_json_courselabel_folderid_pairs():
     """Loads courseLabel_folderId_pairs.json as dict if exists, returns empty dict if not
     Returns:
         [dict]: dict(courseLabel_folderId_pairs)
     """
     try:
-        with open(f"{BASE}/data/courseLabel_folderId_pairs.json") as f:
+        with open(f"{Logger.run_dir()}/data/courseLabel_folderId_pairs.json") as f:
             courseLabel_folderId_pairs = json.load(f)
     except:
         courseLabel_folderId_pairs = {}
@@ -354,8 +419,10 @@ def check_json_courselabel_folderid_pairs():
     return courseLabel_folderId_pairs
 
 
-def create_list_entry(results, recording_type = 0):
+def create_list_entry(results, recording_type = 0, rec_data = None):
     """Generates entry data for either the private or the public download report
+        The stream url of a public recording is carried on the entry when its /data response (rec_data)
+        is given, so the download step does not need to request it again
     Returns:
         Recording data dictionary (distinct dictionary for private or public entry) 
         Recording id of incomplete data dictionary
@@ -392,6 +459,12 @@ def create_list_entry(results, recording_type = 0):
         LOGGER.error(f"Expected key in dict: {ke}")
         failed_pre_download = results["id"]
 
+    if entry_data != {} and rec_data is not None:
+        try:
+            entry_data["stream_url"] = rec_data["extStreams"][0]["streamUrl"]
+        except (KeyError, IndexError, TypeError):
+            LOGGER.debug(f"No stream url in recording data for {results['id']}")
+
     return entry_data, failed_pre_download
 
 def recording_storage_size(url: str):
@@ -404,15 +477,18 @@ def recording_storage_size(url: str):
     handle_types(*[(url, "")])
 
     try:
-        r = requests.get(url, stream=True, headers={"Accept-Encoding": None})
+        r = Http.get(url, stream=True, headers={"Accept-Encoding": None})
     except requests.exceptions.MissingSchema as e:
         LOGGER.error(str(e))
         raise requests.exceptions.MissingSchema(str(e))
+    # only the headers are needed: close rather than leave the connection open with the body unread
+    r.close()
 
     return int(r.headers.get("content-length", 0))
 
 def get_downloads_list(downloads_path: str):
     """Gets list of mp4 files in Collab /downloads folder 
+        Recordings registered for Stream transfer mode are listed as if they were in the folder
     Args:
         downloads_path (string): Path to Collab downloads folder
     Returns:
@@ -424,9 +500,38 @@ def get_downloads_list(downloads_path: str):
     for file in os.scandir(downloads_path):
         if file.path.endswith(".mp4"):
             downloads_list.append(file.path)
+    for filename in list(g_stream_sources):
+        downloads_list.append(os.path.join(downloads_path, filename))
 
     return downloads_list
 
+def register_stream_source(filename: str, url: str):
+    """Stream transfer mode: records the Collab stream url of a recording in place of a downloaded file
+    Args:
+        filename (str): download filename the recording would have been saved as
+        url (str or callable): Collab recording url, or callable issuing it at transfer start
+    """
+    LOGGER.debug(f"{filename}")
+    g_stream_sources[filename] = url
+
+def get_stream_source(path: str):
+    """Returns Collab stream url (or url issuer) registered for the download path, or None for a local file
+    """
+    return g_stream_sources.get(os.path.basename(path))
+
+def remove_download(path: str):
+    """Removes recording from the downloads: local file or registered stream source.
+        Releases its spool reservation
+    """
+    Spool.release(os.path.basename(path))
+    if os.path.basename(path) in g_stream_sources:
+        g_stream_sources.pop(os.path.basename(path), None)
+    else:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            LOGGER.debug(f"Already removed: {path}")
+
 def get_folder_download_matches(courseLabels_folderIds: dict, downloads_list: list):
     """ Matches course_label extracted from mp4 file name in Collab /downloads to Panopto folder_id
         Adds {folder_id: [download]} to matches dict. 
@@ -500,12 +605,15 @@ def return_absent_present(present_on_ppto: list, list_of_recordings: list, check
 def build_undiscovered():
     courseLabel_folderId_pairs = check_json_courselabel_folderid_pairs()
     for courseLabel, folderId in courseLabel_folderId_pairs.items():
-        if courseLabel == g_current_course_label:
-            global g_undiscovered_course_folders
-            g_undiscovered_course_folders[courseLabel] = folderId
+        if courseLabel == current_course_label():
+            with g_undiscovered_lock:
+                g_undiscovered_course_folders[courseLabel] = folderId
 
 def undiscovered_course_folders():
-    return g_undiscovered_course_folders
+    """Returns copy of the {courseLabel: folderId} of courses with undiscovered uploads
+    """
+    with g_undiscovered_lock:
+        return dict(g_undiscovered_course_folders)
         
 def get_recording_date_created(path, rec_ids_date_created):
     """extracting date part from datetime value
@@ -559,10 +667,12 @@ def save_chatfile_as_csv(fname, json_info, header):
 
 def pre_run_reset():
     """Procedure to remove json lookup file + remove .mp4 files from downloads folder 
-        before starting a new run
+        before starting a new run (a backfill shard resets its own lookup file and downloads folder).
+        Unfinished .part downloads are kept so they can be resumed, unless they are older
+        than globalConfig.DownloadPartMaxAge days
     """
-    json_filepath = "./data/courseLabel_folderId_pairs.json"
-    downloads_dir = "./downloads/"
+    json_filepath = f"{Logger.run_dir()}/data/courseLabel_folderId_pairs.json"
+    downloads_dir = Spool.path()
     
     # remove json file
     try:
@@ -571,21 +681,53 @@ def pre_run_reset():
     except OSError as e:
         LOGGER.error(str(e))
 
-    # remove .mp4 files from downloads folder
+    # remove .mp4 files + stale .part files from downloads folder
     try:
+        max_age = globalConfig.DownloadPartMaxAge * 24 * 3600
         for file in os.listdir(downloads_dir):
-            os.remove(os.path.join(downloads_dir, file))
+            path = os.path.join(downloads_dir, file)
+            if file.endswith((".part", ".part.json")) and time.time() - os.path.getmtime(path) < max_age:
+                continue
+            os.remove(path)
     except OSError as e:
         LOGGER.error(str(e))
 
 
+def register_shutdown_hook(hook):
+    """Registers function called once before the process exits (normally, via os._exit or run_restart)
+    """
+    g_shutdown_hooks.append(hook)
+
+
+def run_shutdown_hooks():
+    """Calls registered shutdown hooks (last registered first), each one only once
+    """
+    while g_shutdown_hooks:
+        hook = g_shutdown_hooks.pop()
+        try:
+            hook()
+        except Exception as e:
+            LOGGER.error(f"Shutdown hook failed: {e}")
+
+atexit.register(run_shutdown_hooks)
+
+
+def is_restarted():
+    """True if this process was started by run_restart (re-executed after a crash)
+    """
+    return os.environ.get(RESTART_ENV) == "1"
+
+
 def run_restart():
     """Procedure to restart application for unexpected crashes such as network issues
+        Resources are released (shutdown hooks) before the process is replaced
     """
     try:
         msg = f"\n--- RESTARTING THE RUN ---"
         print(msg)
         LOGGER.info(msg)
+        run_shutdown_hooks()
+        os.environ[RESTART_ENV] = "1"
         time.sleep(globalConfig.RestartTimeSleep)
         python = sys.executable
         os.execl(python, python, * sys.argv)
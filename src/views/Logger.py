@@ -4,13 +4,26 @@ from logging.config import fileConfig
 
 BASE = os.getcwd()
 
+# set by the backfill run in the environment of each shard process: folder of the shard's own
+# logs, reports and lookup files (processes running at once don't write to the same files)
+RUN_DIR_ENV = "COLLAB2PANOPTO_RUN_DIR"
+
+
+def run_dir():
+    """Returns folder of the run files (.logs, reports, data lookup file): the shard folder 
+        for a backfill shard, the application folder otherwise
+    """
+    return os.environ.get(RUN_DIR_ENV) or BASE
+
 
 def init_logger(name):
-    __log_main_path = os.getcwd() + "/.logs/info.log"
-    __log_dbg_path = os.getcwd() + "/.logs/dbg.log"
+    __log_main_path = run_dir() + "/.logs/info.log"
+    __log_dbg_path = run_dir() + "/.logs/dbg.log"
     __create_files([str(__log_main_path), str(__log_dbg_path)])
 
-    fileConfig(f"{BASE}/config/logger.ini", disable_existing_loggers=False)
+    # log file paths given as python literals (handler args are evaluated)
+    log_paths = {"info_log": repr(__log_main_path), "dbg_log": repr(__log_dbg_path)}
+    fileConfig(f"{BASE}/config/logger.ini", defaults=log_paths, disable_existing_loggers=False)
     logger = logging.getLogger(name)
 
     __set_levels()
@@ -17,8 +17,8 @@ def create_download_public_report(report_public: list[list]):
         report (list[list]): raw data from each downloaded recording 
     """
 
-    Utils.create_dir_if_not_exists("./reports")
-    filename = "./reports/collab_download_public_report.txt"
+    Utils.create_dir_if_not_exists(f"{Logger.run_dir()}/reports")
+    filename = f"{Logger.run_dir()}/reports/collab_download_public_report.txt"
 
     table = PrettyTable(
         [
@@ -54,7 +54,8 @@ def create_download_private_report(report_private: list[list]):
     Args:
         report (list[list]): raw data from each downloaded recording
     """
-    filename = "./reports/collab_download_private_report.txt"
+    Utils.create_dir_if_not_exists(f"{Logger.run_dir()}/reports")
+    filename = f"{Logger.run_dir()}/reports/collab_download_private_report.txt"
 
     table = PrettyTable(
         [